@@ -0,0 +1,176 @@
+"""Load and latency benchmark for the Grenton objects integration.
+
+Creates hundreds of light, cover and sensor entities against the Gate
+simulator and measures full poll cycles:
+
+    python -m benchmarks.bench --lights 120 --covers 30 --sensors 60
+
+Modes:
+    per_entity  one request per entity, as before the coordinator existed
+    batched     one coordinator request per cycle
+    aggregate   coordinator with aggregate_reads enabled
+    compact     coordinator with compact_reads enabled
+    split       coordinator with one concurrent request per CLU
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from homeassistant.core import HomeAssistant
+from custom_components.grenton_objects.client import GrentonClient
+from custom_components.grenton_objects.coordinator import GrentonCoordinator
+from custom_components.grenton_objects.cover import GrentonCover
+from custom_components.grenton_objects.light import GrentonLight
+from custom_components.grenton_objects.objects import GrentonObjectRef
+from custom_components.grenton_objects.sensor import GrentonSensor
+from .simulator import GateSimulator, parse_clu_latencies
+
+MODES = ("per_entity", "batched", "aggregate", "compact", "split")
+SINGLE_REQUEST_MODES = ("batched", "aggregate", "compact")
+CLU_IDS = ("CLU221001090", "CLU221001091", "CLU221001092")
+LIGHT_FAMILIES = (("DOU", "DOUT"), ("DIM", "DIMMER"), ("LED", "RGB"))
+
+def create_entities(coordinator, endpoint, lights, covers, sensors):
+    entities = []
+    for number in range(lights):
+        family, grenton_type = LIGHT_FAMILIES[number % len(LIGHT_FAMILIES)]
+        grenton_object = GrentonObjectRef(f"{CLU_IDS[number % len(CLU_IDS)]}->{family}{1000 + number}")
+        entities.append(GrentonLight(coordinator, endpoint, grenton_object, grenton_type, f"Light {number}"))
+    for number in range(covers):
+        grenton_object = GrentonObjectRef(f"{CLU_IDS[number % len(CLU_IDS)]}->ROL{1000 + number}")
+        entities.append(GrentonCover(coordinator, endpoint, grenton_object, False, f"Cover {number}"))
+    for number in range(sensors):
+        grenton_object = GrentonObjectRef(f"{CLU_IDS[number % len(CLU_IDS)]}->TEM{1000 + number}")
+        entities.append(GrentonSensor(coordinator, endpoint, grenton_object, "UNKNOWN", f"Sensor {number}", "°C"))
+    for number, entity in enumerate(entities):
+        entity.hass = coordinator.hass
+        entity.entity_id = f"bench.grenton_{number}"
+    return entities
+
+def seed_simulator(simulator, entities):
+    for entity in entities:
+        grenton_object = entity._grenton_object
+        for index in entity._status_features().values():
+            value = "#ff8000" if index == 6 and grenton_object.family == "LED" else 0
+            simulator.set_feature(grenton_object.clu_id, grenton_object.object_id, index, value)
+
+async def run_cycle(mode, coordinator, entities):
+    if mode == "per_entity":
+        results = await asyncio.gather(*(coordinator.client.get(entity._status_command()) for entity in entities))
+        for entity, data in zip(entities, results):
+            entity._update_from_status(entity._status_schema().decode(data))
+        return
+    for entity in entities:
+        coordinator.mark_due(entity.entity_id)
+    await coordinator.async_refresh()
+    if not coordinator.last_update_success:
+        raise RuntimeError(f"Poll cycle failed: {coordinator.last_exception}")
+    for entity in entities:
+        entity._update_from_status(coordinator.data[entity.entity_id])
+
+async def run_mode(hass, simulator, endpoint, mode, args):
+    client = GrentonClient(hass, endpoint, max_in_flight=len(CLU_IDS), split_by_clu=mode == "split")
+    coordinator = GrentonCoordinator(
+        hass,
+        client,
+        timedelta(seconds=30),
+        timedelta(seconds=120),
+        mode == "aggregate",
+        compact_reads=mode == "compact"
+    )
+    entities = create_entities(coordinator, endpoint, args.lights, args.covers, args.sensors)
+    for entity in entities:
+        coordinator.register(
+            entity.entity_id,
+            entity._status_command(),
+            entity._grenton_object,
+            entity._status_schema(),
+            entity._fast_poll_interval
+        )
+    seed_simulator(simulator, entities)
+
+    # The first reads are spread over several refreshes in startup batches.
+    while mode != "per_entity" and not all(entity.entity_id in (coordinator.data or {}) for entity in entities):
+        await coordinator.async_refresh()
+    await run_cycle(mode, coordinator, entities)
+    simulator.reset_stats()
+    latencies = []
+    cpu_times = []
+    for _ in range(args.cycles):
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await run_cycle(mode, coordinator, entities)
+        cpu_times.append(time.process_time() - cpu_started)
+        latencies.append(time.perf_counter() - started)
+
+    return {
+        "mode": mode,
+        "entities": len(entities),
+        "requests_per_cycle": simulator.requests / args.cycles,
+        "expressions_per_cycle": simulator.expressions / args.cycles,
+        "request_bytes_per_cycle": simulator.request_bytes / args.cycles,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": statistics.quantiles(latencies, n=100)[98] * 1000 if len(latencies) > 1 else latencies[0] * 1000,
+        "cpu_ms_per_cycle": statistics.mean(cpu_times) * 1000,
+    }
+
+async def run(args):
+    simulator = GateSimulator(
+        args.latency,
+        args.expression_latency,
+        concurrent=args.concurrent,
+        clu_latencies=parse_clu_latencies(args.clu_latency)
+    )
+    endpoint = await simulator.start(port=args.port)
+    results = []
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        try:
+            for mode in args.modes:
+                results.append(await run_mode(hass, simulator, endpoint, mode, args))
+        finally:
+            await simulator.stop()
+            await hass.async_stop(force=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Grenton objects benchmark")
+    parser.add_argument("--lights", type=int, default=120)
+    parser.add_argument("--covers", type=int, default=30)
+    parser.add_argument("--sensors", type=int, default=60)
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated seconds per request")
+    parser.add_argument("--expression-latency", type=float, default=0.0005, help="simulated seconds per expression")
+    parser.add_argument("--concurrent", action="store_true", help="simulate a Gate serving different CLUs concurrently")
+    parser.add_argument("--clu-latency", action="append", metavar="CLU=SECONDS", help="extra seconds for requests to a CLU")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--max-requests-per-cycle", type=float, help="fail if the batched or aggregate mode sends more requests per cycle")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(
+                f"{result['mode']:<11} entities={result['entities']} "
+                f"requests/cycle={result['requests_per_cycle']:.1f} "
+                f"expressions/cycle={result['expressions_per_cycle']:.1f} "
+                f"bytes/cycle={result['request_bytes_per_cycle']:.0f} "
+                f"p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms "
+                f"cpu={result['cpu_ms_per_cycle']:.1f}ms"
+            )
+    if args.max_requests_per_cycle is not None:
+        for result in results:
+            if result["mode"] in SINGLE_REQUEST_MODES and result["requests_per_cycle"] > args.max_requests_per_cycle:
+                print(f"{result['mode']} exceeded {args.max_requests_per_cycle} requests per cycle", file=sys.stderr)
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Stand-in for a Gate HTTP with the HAlistener script.
+
+Evaluates the Lua command strings sent by the integration against an
+in-memory object model, including object discovery, with configurable latency per request and per
+evaluated expression. Run it standalone with:
+
+    python -m benchmarks.simulator --port 8080 --latency 0.02
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import re
+from aiohttp import web
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PATH = '/HAlistener'
+
+EXECUTE_PATTERN = re.compile(r"^(?:return )?(\w+):execute\(0, '(.*)'\)$", re.S)
+REMOTE_EXECUTE_PATTERN = re.compile(r"(\w+):execute\(0, '(.*?)'\)")
+OBJECT_CALL_PATTERN = re.compile(r"(\w+):(get|set|execute)\((\d+)(?:, (.*?))?\)")
+GET_VAR_PATTERN = re.compile(r'getVar\("(\w+)"\)')
+AGGREGATE_SEPARATOR_PATTERN = re.compile(r'\}, "(.*)"\)$')
+VERSION_CHECK_PATTERN = re.compile(r'^if tostring\(getVar\("(\w+)"\)\) == "(.*?)" then return "(.*?)" end ')
+
+# Feature changed by execute(index, value) for families whose methods map
+# onto a different feature than the method index.
+EXECUTE_FEATURES = {
+    ("ROL", 10): 7,
+    ("ROL", 9): 8,
+    ("ZWA", 7): 4,
+}
+
+def parse_value(value):
+    value = value.strip()
+    if value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def lua_tostring(value):
+    if value is None:
+        return "nil"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class GateSimulator:
+    def __init__(self, latency=0.0, expression_latency=0.0, path=DEFAULT_PATH, concurrent=False, clu_latencies=None):
+        self.latency = latency
+        self.expression_latency = expression_latency
+        self.path = path
+        self.concurrent = concurrent
+        self.clu_latencies = clu_latencies or {}
+        self.objects = {}
+        self.variables = {}
+        self.requests = 0
+        self.expressions = 0
+        self.request_bytes = 0
+        self._lock = asyncio.Lock()
+        self._clu_locks = {}
+        self._runner = None
+
+    def reset_stats(self):
+        self.requests = 0
+        self.expressions = 0
+        self.request_bytes = 0
+
+    def set_feature(self, clu_id, object_id, index, value):
+        self.objects.setdefault((clu_id, object_id), {})[index] = value
+
+    def get_feature(self, clu_id, object_id, index):
+        return self.objects.get((clu_id, object_id), {}).get(index, 0)
+
+    def _call(self, clu_id, object_id, method, index, value):
+        self.expressions += 1
+        index = int(index)
+        if method == "get":
+            return self.get_feature(clu_id, object_id, index)
+        value = parse_value(value) if value is not None else None
+        if method == "execute":
+            index = EXECUTE_FEATURES.get((object_id[:3], index), index)
+        self.set_feature(clu_id, object_id, index, value)
+        return None
+
+    def _evaluate_variables(self, clu_id, code):
+        # Bulk variable reads, optionally preceded by a version check.
+        match = VERSION_CHECK_PATTERN.match(code)
+        if match:
+            self.expressions += 1
+            if lua_tostring(self.variables.get((clu_id, match.group(1)))) == match.group(2):
+                return match.group(3)
+            code = code[match.end():]
+        separator = AGGREGATE_SEPARATOR_PATTERN.search(code).group(1)
+        values = []
+        for name in GET_VAR_PATTERN.findall(code):
+            self.expressions += 1
+            values.append(self.variables.get((clu_id, name)))
+        return separator.join(lua_tostring(value) for value in values)
+
+    def _is_variables_code(self, code):
+        return code.startswith("if tostring(getVar(") or (
+            code.startswith("return table.concat(") and "getVar(" in code and ":execute(" not in code
+        )
+
+    def _evaluate_on_clu(self, clu_id, code):
+        if self._is_variables_code(code):
+            return self._evaluate_variables(clu_id, code)
+        if "pairs(_G)" in code:
+            self.expressions += 1
+            return ";".join(object_id for clu, object_id in self.objects if clu == clu_id)
+        if code.startswith("return table.concat("):
+            separator = AGGREGATE_SEPARATOR_PATTERN.search(code).group(1)
+            values = [
+                self._call(clu_id, *call)
+                for call in OBJECT_CALL_PATTERN.findall(code)
+            ]
+            return separator.join(lua_tostring(value) for value in values)
+        match = GET_VAR_PATTERN.search(code)
+        if match:
+            self.expressions += 1
+            return self.variables.get((clu_id, match.group(1)))
+        # A chunk of several statements, e.g. a group command, runs all of
+        # them and returns nothing.
+        calls = OBJECT_CALL_PATTERN.findall(code)
+        if len(calls) == 1:
+            return self._call(clu_id, *calls[0])
+        if calls:
+            for call in calls:
+                self._call(clu_id, *call)
+            return None
+        raise ValueError(f"Unsupported CLU code: {code}")
+
+    def _clu_calls(self, expression):
+        return max(len(REMOTE_EXECUTE_PATTERN.findall(expression)), 1)
+
+    def _clu_of(self, expression):
+        match = EXECUTE_PATTERN.match(expression) or REMOTE_EXECUTE_PATTERN.search(expression)
+        return match.group(1) if match else None
+
+    def evaluate(self, expression):
+        if self._is_variables_code(expression):
+            return self._evaluate_variables(None, expression)
+        if expression.startswith("return table.concat("):
+            # Compact reads concatenate several CLU calls on the Gate.
+            separator = AGGREGATE_SEPARATOR_PATTERN.search(expression).group(1)
+            values = [
+                self._evaluate_on_clu(*call)
+                for call in REMOTE_EXECUTE_PATTERN.findall(expression)
+            ]
+            return separator.join(lua_tostring(value) for value in values)
+        match = EXECUTE_PATTERN.match(expression)
+        if match:
+            return self._evaluate_on_clu(*match.groups())
+        match = GET_VAR_PATTERN.search(expression)
+        if match:
+            self.expressions += 1
+            return self.variables.get((None, match.group(1)))
+        raise ValueError(f"Unsupported expression: {expression}")
+
+    async def handle(self, request):
+        body = await request.read()
+        self.requests += 1
+        self.request_bytes += len(body)
+        payload = await request.json()
+        if "command" not in payload and "status" not in payload:
+            return web.json_response({"g_status": "Grenton script ERROR"}, status=400)
+        clu_ids = sorted({self._clu_of(expression) for expression in payload.values()}, key=str)
+        # The Gate runs the listener script for one request at a time, in
+        # concurrent mode only requests to the same CLU wait for each other.
+        if self.concurrent:
+            locks = [self._clu_locks.setdefault(clu_id, asyncio.Lock()) for clu_id in clu_ids]
+        else:
+            locks = [self._lock]
+        async with contextlib.AsyncExitStack() as stack:
+            for lock in locks:
+                await stack.enter_async_context(lock)
+            await asyncio.sleep(
+                self.latency
+                + self.expression_latency * sum(self._clu_calls(expression) for expression in payload.values())
+                + sum(self.clu_latencies.get(clu_id, 0) for clu_id in clu_ids)
+            )
+            response = {"g_status": "OK"}
+            for key, expression in payload.items():
+                result = self.evaluate(expression)
+                if result is not None:
+                    response[key] = result
+        return web.json_response(response)
+
+    async def start(self, host="127.0.0.1", port=8080):
+        app = web.Application()
+        app.router.add_route("GET", self.path, self.handle)
+        app.router.add_route("POST", self.path, self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return f"http://{host}:{port}{self.path}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def parse_clu_latencies(values):
+    clu_latencies = {}
+    for value in values or []:
+        clu_id, latency = value.split("=", 1)
+        clu_latencies[clu_id] = float(latency)
+    return clu_latencies
+
+async def _serve(args):
+    simulator = GateSimulator(
+        args.latency,
+        args.expression_latency,
+        concurrent=args.concurrent,
+        clu_latencies=parse_clu_latencies(args.clu_latency)
+    )
+    url = await simulator.start(args.host, args.port)
+    _LOGGER.info(f"Gate simulator listening on {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Grenton Gate HTTP simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--expression-latency", type=float, default=0.0, help="seconds added per expression")
+    parser.add_argument("--concurrent", action="store_true", help="serve requests to different CLUs concurrently")
+    parser.add_argument("--clu-latency", action="append", metavar="CLU=SECONDS", help="extra seconds for requests to a CLU")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(args))
+
+if __name__ == "__main__":
+    main()
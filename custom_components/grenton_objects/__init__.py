@@ -1 +1,129 @@
 """Grenton objects integration."""
+import logging
+import voluptuous as vol
+from datetime import timedelta
+from homeassistant.components import webhook
+from homeassistant.core import SupportsResponse
+from homeassistant.const import Platform
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.start import async_at_start
+from .discovery import async_discover, SUPPORTED_PLATFORMS
+from .state_cache import GrentonStateCache
+from .const import (
+    DOMAIN,
+    CONF_WEBHOOK_ID,
+    CONF_RECONCILE_INTERVAL,
+    CONF_AGGREGATE_READS,
+    CONF_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_SLOW_SCAN_INTERVAL,
+    CONF_CONNECT_TIMEOUT,
+    CONF_READ_TIMEOUT,
+    CONF_STARTUP_BATCH_SIZE,
+    CONF_MAX_IN_FLIGHT,
+    CONF_SPLIT_BY_CLU,
+    CONF_COMPACT_READS,
+    CONF_BULK_VARIABLES,
+    CONF_VERSION_VARIABLE,
+    CONF_DISCOVERY,
+    CONF_API_ENDPOINT,
+    CONF_CLUS,
+    CONF_FAMILIES,
+    CONF_EXCLUDE,
+    CONF_GATEWAYS,
+    CONF_FALLBACK_ENDPOINTS,
+    DATA_CONFIG,
+    DATA_COORDINATORS,
+    DATA_HASS_CONFIG,
+    DATA_STATE_CACHE,
+    SERVICE_DUMP_DIAGNOSTICS
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_RECONCILE_INTERVAL = timedelta(minutes=5)
+
+DISCOVERY_SCHEMA = vol.Schema({
+    vol.Required(CONF_API_ENDPOINT): str,
+    vol.Required(CONF_CLUS): vol.All(cv.ensure_list, [str]),
+    vol.Optional(CONF_FAMILIES, default={}): {str: vol.All(vol.Coerce(Platform), vol.In(SUPPORTED_PLATFORMS))},
+    vol.Optional(CONF_EXCLUDE, default=[]): vol.All(cv.ensure_list, [str])
+})
+
+GATEWAY_SCHEMA = vol.Schema({
+    vol.Required(CONF_API_ENDPOINT): str,
+    vol.Required(CONF_FALLBACK_ENDPOINTS): vol.All(cv.ensure_list, [str], vol.Length(min=1))
+})
+
+CONFIG_SCHEMA = vol.Schema({
+    vol.Optional(DOMAIN): vol.Schema({
+        vol.Optional(CONF_WEBHOOK_ID): cv.string,
+        vol.Optional(CONF_RECONCILE_INTERVAL, default=DEFAULT_RECONCILE_INTERVAL): cv.time_period,
+        vol.Optional(CONF_AGGREGATE_READS, default=False): cv.boolean,
+        vol.Optional(CONF_SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_MAX_SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_SLOW_SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_CONNECT_TIMEOUT): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+        vol.Optional(CONF_READ_TIMEOUT): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+        vol.Optional(CONF_STARTUP_BATCH_SIZE): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_MAX_IN_FLIGHT): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_SPLIT_BY_CLU, default=False): cv.boolean,
+        vol.Optional(CONF_COMPACT_READS, default=False): cv.boolean,
+        vol.Optional(CONF_BULK_VARIABLES, default=False): cv.boolean,
+        vol.Optional(CONF_VERSION_VARIABLE): cv.string,
+        vol.Optional(CONF_DISCOVERY, default=[]): vol.All(cv.ensure_list, [DISCOVERY_SCHEMA]),
+        vol.Optional(CONF_GATEWAYS, default=[]): vol.All(cv.ensure_list, [GATEWAY_SCHEMA])
+    })
+}, extra=vol.ALLOW_EXTRA)
+
+async def async_setup(hass, config):
+    conf = config.get(DOMAIN, {})
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    domain_data[DATA_CONFIG] = conf
+    domain_data[DATA_HASS_CONFIG] = config
+
+    state_cache = GrentonStateCache(hass)
+    await state_cache.async_load()
+    domain_data[DATA_STATE_CACHE] = state_cache
+
+    webhook_id = conf.get(CONF_WEBHOOK_ID)
+    if webhook_id:
+        webhook.async_register(
+            hass, DOMAIN, "Grenton objects", webhook_id, async_handle_webhook, local_only=True
+        )
+
+    async def async_dump_diagnostics(call):
+        return {
+            api_endpoint: coordinator.diagnostics()
+            for api_endpoint, coordinator in hass.data[DOMAIN].get(DATA_COORDINATORS, {}).items()
+        }
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_DUMP_DIAGNOSTICS, async_dump_diagnostics, supports_response=SupportsResponse.ONLY
+    )
+
+    # Discovery waits until the YAML platforms are set up, so objects
+    # configured by hand keep their configuration.
+    if conf.get(CONF_DISCOVERY):
+        async def async_start_discovery(hass):
+            await async_discover(hass, conf[CONF_DISCOVERY])
+
+        async_at_start(hass, async_start_discovery)
+
+    return True
+
+async def async_handle_webhook(hass, webhook_id, request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        _LOGGER.error("Received invalid Grenton push payload")
+        return
+    if not isinstance(payload, dict):
+        _LOGGER.error(f"Received invalid Grenton push payload: {payload}")
+        return
+
+    handled = set()
+    for coordinator in hass.data[DOMAIN].get(DATA_COORDINATORS, {}).values():
+        handled |= coordinator.async_push(payload)
+    for grenton_id in payload.keys() - handled:
+        _LOGGER.debug(f"Received push update for unknown Grenton object {grenton_id}")
@@ -1,4 +1,3 @@
-import requests
 import logging
 import json
 import voluptuous as vol
@@ -7,6 +6,10 @@ from homeassistant.components.binary_sensor import (
     PLATFORM_SCHEMA
 )
 from homeassistant.const import (STATE_ON, STATE_OFF)
+from .coordinator import get_coordinator
+from .decoder import GrentonStatusSchema, decode_bool, decode_int
+from .entity import GrentonEntity
+from .objects import get_object_ref
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -15,27 +18,54 @@ DOMAIN = 'grenton_objects'
 CONF_API_ENDPOINT = 'api_endpoint'
 CONF_GRENTON_ID = 'grenton_id'
 CONF_OBJECT_NAME = 'name'
+CONF_EDGE_COUNTER = 'edge_counter'
+
+# Pulses replayed at most per poll, so a bouncing input does not flood
+# the state machine.
+MAX_REPLAYED_PULSES = 10
+
+STATUS_SCHEMA = GrentonStatusSchema({"is_on": (0, decode_bool)})
+# The counter is a user feature read along with the input.
+EDGE_STATUS_SCHEMA = GrentonStatusSchema({"is_on": (0, decode_bool), "edges": (None, decode_int)})
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_API_ENDPOINT): str,
     vol.Required(CONF_GRENTON_ID): str,
-    vol.Optional(CONF_OBJECT_NAME, default='Grenton Binary Sensor'): str
+    vol.Optional(CONF_OBJECT_NAME, default='Grenton Binary Sensor'): str,
+    vol.Optional(CONF_EDGE_COUNTER): str
 })
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    if discovery_info is not None:
+        api_endpoint = discovery_info[CONF_API_ENDPOINT]
+        coordinator = get_coordinator(hass, api_endpoint)
+        async_add_entities([
+            GrentonBinarySensor(coordinator, api_endpoint, get_object_ref(hass, grenton_id), grenton_id)
+            for grenton_id in discovery_info["grenton_ids"]
+        ])
+        return
+
     api_endpoint = config.get(CONF_API_ENDPOINT)
     grenton_id = config.get(CONF_GRENTON_ID)
     object_name = config.get(CONF_OBJECT_NAME)
+    edge_counter = config.get(CONF_EDGE_COUNTER)
+
+    coordinator = get_coordinator(hass, api_endpoint)
+    grenton_object = get_object_ref(hass, grenton_id)
+    edge_counter_object = get_object_ref(hass, edge_counter) if edge_counter else None
 
-    add_entities([GrentonBinarySensor(api_endpoint, grenton_id, object_name)], True)
+    async_add_entities([GrentonBinarySensor(coordinator, api_endpoint, grenton_object, object_name, edge_counter_object)])
 
-class GrentonBinarySensor(BinarySensorEntity):
-    def __init__(self, api_endpoint, grenton_id, object_name):
+class GrentonBinarySensor(GrentonEntity, BinarySensorEntity):
+    def __init__(self, coordinator, api_endpoint, grenton_object, object_name, edge_counter=None):
+        super().__init__(coordinator)
         self._api_endpoint = api_endpoint
-        self._grenton_id = grenton_id
+        self._grenton_object = grenton_object
         self._object_name = object_name
-        self._unique_id = f"grenton_{grenton_id.split('->')[1]}"
+        self._unique_id = f"grenton_{grenton_object.object_id}"
         self._state = None
+        self._edge_counter = edge_counter
+        self._edges = None
 
     @property
     def name(self):
@@ -49,16 +79,38 @@ class GrentonBinarySensor(BinarySensorEntity):
     def is_on(self):
         return self._state == STATE_ON
 
-    def update(self):
-        try:
-            command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(0)')"}
-            response = requests.get(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-            data = response.json()
-            self._state = STATE_OFF if data.get("status") == 0 else STATE_ON
-        except requests.RequestException as ex:
-            _LOGGER.error(f"Failed to update the switch state: {ex}")
-            self._state = None
+    def _status_schema(self):
+        return EDGE_STATUS_SCHEMA if self._edge_counter is not None else STATUS_SCHEMA
+
+    def _status_command(self):
+        command = super()._status_command()
+        if self._edge_counter is not None:
+            command["status_2"] = self._edge_counter.get_var()
+        return command
+
+    def _update_from_status(self, data):
+        is_on = data.get("is_on")
+        state = None if is_on is None else (STATE_ON if is_on else STATE_OFF)
+        self._replay_missed_pulses(data.get("edges"), state)
+        self._state = state
+
+    def _replay_missed_pulses(self, edges, state):
+        # The CLU counts every change of the input. Changes beyond the one
+        # the poll itself shows were pulses that started and ended between
+        # two polls, each is written as a short change to the other state.
+        # Nothing is replayed for the first read after a restart.
+        previous, self._edges = self._edges, edges
+        if edges is None or previous is None or self._stale or state is None or self._state is None:
+            return
+        seen = 0 if state == self._state else 1
+        pulses = min((edges - previous - seen) // 2, MAX_REPLAYED_PULSES)
+        if pulses <= 0:
+            return
+        _LOGGER.debug(f"{self._object_name} changed {pulses} more times between polls")
+        current = self._state
+        other = STATE_OFF if current == STATE_ON else STATE_ON
+        for _ in range(pulses):
+            self._state = other
+            self.async_write_ha_state()
+            self._state = current
+            self.async_write_ha_state()
@@ -0,0 +1,332 @@
+"""Grenton Gate HTTP client."""
+import aiohttp
+import asyncio
+import json
+import logging
+import random
+import time
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.event import async_call_later
+from .metrics import GrentonMetrics
+
+_LOGGER = logging.getLogger(__name__)
+
+COMMAND_BATCH_WINDOW = 0.01
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+READ_RETRIES = 2
+RETRY_BACKOFF = 0.2
+FAILURE_THRESHOLD = 3
+RECOVERY_TIME = 30
+MAX_IN_FLIGHT = 2
+
+class GrentonTimeoutError(aiohttp.ClientError):
+    pass
+
+class GrentonUnavailableError(aiohttp.ClientError):
+    pass
+
+class GrentonCircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, recovery_time=RECOVERY_TIME):
+        self._failure_threshold = failure_threshold
+        self._recovery_time = recovery_time
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    @property
+    def allows_request(self):
+        return self._opened_at is None or (
+            not self._probing and time.monotonic() - self._opened_at >= self._recovery_time
+        )
+
+    def before_request(self):
+        # While open every request fails fast, except for a single probe
+        # once the recovery time has passed.
+        if self._opened_at is None:
+            return
+        if self._probing or time.monotonic() - self._opened_at < self._recovery_time:
+            raise GrentonUnavailableError("Gate is unavailable")
+        self._probing = True
+
+    def record_success(self):
+        was_open = self.is_open
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        return was_open
+
+    def record_failure(self):
+        was_open = self.is_open
+        self._failures += 1
+        self._probing = False
+        if was_open or self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+        return not was_open and self.is_open
+
+class GrentonGateway:
+    # One Gate HTTP module of a client, with its own breaker and request
+    # slots since each Gate runs its listener script independently.
+    __slots__ = ("api_endpoint", "breaker", "semaphore", "outstanding")
+
+    def __init__(self, api_endpoint, max_in_flight):
+        self.api_endpoint = api_endpoint
+        self.breaker = GrentonCircuitBreaker()
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.outstanding = 0
+
+    def as_dict(self):
+        return {
+            "available": not self.breaker.is_open,
+            "outstanding": self.outstanding
+        }
+
+class GrentonClient:
+    def __init__(self, hass, api_endpoint, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, max_in_flight=MAX_IN_FLIGHT, split_by_clu=False, fallback_endpoints=()):
+        self._hass = hass
+        self._api_endpoint = api_endpoint
+        self._timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        # Fallback Gates reach the same CLUs as the primary one.
+        self._gateways = [
+            GrentonGateway(endpoint, max_in_flight)
+            for endpoint in (api_endpoint, *fallback_endpoints)
+        ]
+        self._available = True
+        self._reads = 0
+        self._max_in_flight = max_in_flight
+        self._split_by_clu = split_by_clu
+        self._clu_locks = {}
+        self._metrics = GrentonMetrics()
+        self._availability_listeners = []
+        self._session = None
+        self._pending_commands = {}
+        self._cancel_flush = None
+
+    @property
+    def api_endpoint(self):
+        return self._api_endpoint
+
+    @property
+    def max_in_flight(self):
+        return self._max_in_flight
+
+    @property
+    def split_by_clu(self):
+        return self._split_by_clu
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def gateways(self):
+        return self._gateways
+
+    @property
+    def available(self):
+        return any(not gateway.breaker.is_open for gateway in self._gateways)
+
+    def add_availability_listener(self, listener):
+        self._availability_listeners.append(listener)
+
+    def _get_session(self):
+        # One session on Home Assistant's connection pool, so a burst of
+        # commands reuses open connections instead of a new TCP handshake
+        # per call. Home Assistant closes it when it stops, concurrent
+        # requests per Gate are already limited by its semaphore.
+        if self._session is None:
+            self._session = async_create_clientsession(self._hass)
+        return self._session
+
+    def _notify_availability(self, gateway, available):
+        if available:
+            _LOGGER.info(f"Gate {gateway.api_endpoint} is available again")
+        else:
+            _LOGGER.warning(f"Gate {gateway.api_endpoint} stopped responding, pausing requests")
+        # Listeners only hear about the client as a whole, which stays
+        # available while any of its Gates answers.
+        if self.available == self._available:
+            return
+        self._available = self.available
+        for listener in self._availability_listeners:
+            listener(self._available)
+
+    def _candidates(self, method):
+        # Reads go to the Gate with the fewest outstanding requests, taking
+        # turns between equally busy ones, writes to the first one in the
+        # configured order. Gates whose breaker is open are only probed when
+        # no other Gate is left.
+        gateways = [gateway for gateway in self._gateways if gateway.breaker.allows_request]
+        if method == "GET":
+            self._reads += 1
+            count = len(self._gateways)
+            return sorted(gateways, key=lambda gateway: (
+                gateway.breaker.is_open,
+                gateway.outstanding,
+                (self._gateways.index(gateway) - self._reads) % count
+            ))
+        return sorted(gateways, key=lambda gateway: gateway.breaker.is_open)
+
+    async def _request(self, method, payload, platforms, clu_id, failed):
+        if not self._split_by_clu:
+            return await self._request_gateways(method, payload, platforms, failed)
+        # Requests for one CLU are serialized so a slow CLU only holds up
+        # its own requests, other CLUs are called concurrently.
+        if clu_id not in self._clu_locks:
+            self._clu_locks[clu_id] = asyncio.Lock()
+        async with self._clu_locks[clu_id]:
+            return await self._request_gateways(method, payload, platforms, failed)
+
+    async def _request_gateways(self, method, payload, platforms, failed):
+        # A request that fails on one Gate is sent through the next one right
+        # away. Commands are safe to repeat, they set a state or start a
+        # motion the module is already in. Gates that failed are collected
+        # in failed, a Gate that answers a later attempt is taken out again.
+        gateways = self._candidates(method)
+        if not gateways:
+            raise GrentonUnavailableError(f"Gate {self._api_endpoint} is unavailable")
+        for gateway in gateways:
+            try:
+                result = await self._request_gateway(gateway, method, payload, platforms)
+            except GrentonUnavailableError:
+                if gateway is gateways[-1]:
+                    raise
+                continue
+            except aiohttp.ClientError:
+                failed.add(gateway)
+                if gateway is gateways[-1]:
+                    raise
+                _LOGGER.debug(f"Request to {gateway.api_endpoint} failed, retrying on the next Gate")
+                continue
+            failed.discard(gateway)
+            return result
+
+    def _record_failures(self, failed):
+        # A breaker counts failed requests, not attempts, so the retries of
+        # a single poll cannot open it on their own.
+        for gateway in failed:
+            if gateway.breaker.record_failure():
+                self._notify_availability(gateway, False)
+
+    async def _request_gateway(self, gateway, method, payload, platforms):
+        # The Gate runs its listener script for one request at a time, more
+        # concurrent requests only queue up there and run into timeouts.
+        gateway.outstanding += 1
+        try:
+            async with gateway.semaphore:
+                return await self._send(gateway, method, payload, platforms)
+        finally:
+            gateway.outstanding -= 1
+
+    async def _send(self, gateway, method, payload, platforms):
+        gateway.breaker.before_request()
+        body = json.dumps(payload).encode()
+        bytes_received = 0
+        started = time.monotonic()
+        try:
+            async with self._get_session().request(
+                method,
+                f"{gateway.api_endpoint}",
+                data = body,
+                headers = {"Content-Type": "application/json"},
+                timeout = self._timeout
+            ) as response:
+                response.raise_for_status()
+                result = None
+                if method == "GET":
+                    content = await response.read()
+                    bytes_received = len(content)
+                    result = json.loads(content)
+                else:
+                    bytes_received = response.content_length or 0
+        except asyncio.TimeoutError as ex:
+            self._metrics.record_request(method, platforms, time.monotonic() - started, len(body), bytes_received, timeout=True)
+            raise GrentonTimeoutError(f"Timeout while waiting for {gateway.api_endpoint}") from ex
+        except aiohttp.ClientError:
+            self._metrics.record_request(method, platforms, time.monotonic() - started, len(body), bytes_received, error=True)
+            raise
+        except ValueError:
+            self._metrics.record_request(method, platforms, time.monotonic() - started, len(body), bytes_received, error=True)
+            raise
+        self._metrics.record_request(method, platforms, time.monotonic() - started, len(body), bytes_received)
+        if gateway.breaker.record_success():
+            self._notify_availability(gateway, True)
+        return result
+
+    async def get(self, payload, platforms=None, clu_id=None):
+        # Status reads are idempotent, so they are retried with a jittered
+        # backoff unless the Gate is already considered unavailable.
+        failed = set()
+        try:
+            for attempt in range(READ_RETRIES + 1):
+                try:
+                    return await self._request("GET", payload, platforms, clu_id, failed)
+                except GrentonUnavailableError:
+                    raise
+                except aiohttp.ClientError:
+                    if attempt == READ_RETRIES or not self.available:
+                        raise
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt * (1 + random.random()))
+        finally:
+            self._record_failures(failed)
+
+    async def post(self, payload, platforms=None, clu_id=None):
+        failed = set()
+        try:
+            await self._request("POST", payload, platforms, clu_id, failed)
+        finally:
+            self._record_failures(failed)
+
+    async def command(self, command, target=None, platform=None, clu_id=None):
+        # Commands issued within COMMAND_BATCH_WINDOW are sent as one
+        # multi-key POST. A newer command for the same target replaces the
+        # pending one, so e.g. slider drags only send the last value. The
+        # target names the object and the feature written, commands for
+        # other features of the object are all sent.
+        future = self._hass.loop.create_future()
+        key = target if target is not None else object()
+        futures = [(future, time.monotonic(), platform)]
+        previous = self._pending_commands.pop(key, None)
+        if previous is not None:
+            futures = previous[1] + futures
+        self._pending_commands[key] = (list(command.values()), futures, clu_id)
+        if self._cancel_flush is None:
+            self._cancel_flush = async_call_later(self._hass, COMMAND_BATCH_WINDOW, self._async_flush_commands)
+        await future
+
+    async def _async_flush_commands(self, _now):
+        self._cancel_flush = None
+        pending = self._pending_commands
+        self._pending_commands = {}
+        groups = {}
+        now = time.monotonic()
+        for values, command_futures, clu_id in pending.values():
+            group_key = clu_id if self._split_by_clu else None
+            payload, futures, platforms = groups.setdefault(group_key, ({}, [], set()))
+            for value in values:
+                payload["command" if not payload else f"command_{len(payload) + 1}"] = value
+            for future, queued_at, platform in command_futures:
+                self._metrics.record_queue_delay(now - queued_at)
+                if platform is not None:
+                    platforms.add(platform)
+                futures.append(future)
+        await asyncio.gather(*(
+            self._async_send_commands(payload, futures, platforms, clu_id)
+            for clu_id, (payload, futures, platforms) in groups.items()
+        ))
+
+    async def _async_send_commands(self, payload, futures, platforms, clu_id):
+        try:
+            await self.post(payload, platforms, clu_id)
+        except Exception as ex:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(ex)
+            return
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
@@ -1,4 +1,4 @@
-import requests
+import aiohttp
 import logging
 import json
 import voluptuous as vol
@@ -9,6 +9,15 @@ from homeassistant.components.climate import (
     ClimateEntityFeature
 )
 from homeassistant.const import UnitOfTemperature
+from .coordinator import get_coordinator, PRIORITY_HIGH
+from .decoder import (
+    GrentonStatusSchema,
+    decode_bool,
+    decode_int,
+    decode_number
+)
+from .entity import GrentonEntity
+from .objects import get_object_ref
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -18,31 +27,54 @@ CONF_API_ENDPOINT = 'api_endpoint'
 CONF_GRENTON_ID = 'grenton_id'
 CONF_OBJECT_NAME = 'name'
 
+STATUS_SCHEMA = GrentonStatusSchema({
+    "enabled": (6, decode_bool),
+    "mode": (7, decode_int),
+    "target_temperature": (12, decode_number),
+    "current_temperature": (14, decode_number)
+})
+
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_API_ENDPOINT): str,
     vol.Required(CONF_GRENTON_ID): str,
     vol.Optional(CONF_OBJECT_NAME, default='Grenton Thermostat'): str
 })
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    if discovery_info is not None:
+        api_endpoint = discovery_info[CONF_API_ENDPOINT]
+        coordinator = get_coordinator(hass, api_endpoint)
+        async_add_entities([
+            GrentonClimate(coordinator, api_endpoint, get_object_ref(hass, grenton_id), grenton_id)
+            for grenton_id in discovery_info["grenton_ids"]
+        ])
+        return
+
     api_endpoint = config.get(CONF_API_ENDPOINT)
     grenton_id = config.get(CONF_GRENTON_ID)
     object_name = config.get(CONF_OBJECT_NAME)
 
-    add_entities([GrentonClimate(api_endpoint, grenton_id, object_name)], True)
+    coordinator = get_coordinator(hass, api_endpoint)
+    grenton_object = get_object_ref(hass, grenton_id)
 
-class GrentonClimate(ClimateEntity):
+    async_add_entities([GrentonClimate(coordinator, api_endpoint, grenton_object, object_name)])
+
+class GrentonClimate(GrentonEntity, ClimateEntity):
+    _refresh_priority = PRIORITY_HIGH
+    # Only the measured temperature changes on its own.
+    _slow_attributes = ("enabled", "mode", "target_temperature")
     _enable_turn_on_off_backwards_compatibility = False
     
-    def __init__(self, api_endpoint, grenton_id, object_name):
+    def __init__(self, coordinator, api_endpoint, grenton_object, object_name):
+        super().__init__(coordinator)
         self._api_endpoint = api_endpoint
-        self._grenton_id = grenton_id
+        self._grenton_object = grenton_object
         self._name = object_name
         self._current_temperature = None
         self._target_temperature = None
         self._hvac_mode = HVACMode.OFF
         self._hvac_modes = [HVACMode.OFF, HVACMode.HEAT, HVACMode.COOL]
-        self._unique_id = f"grenton_{grenton_id.split('->')[1]}"
+        self._unique_id = f"grenton_{grenton_object.object_id}"
         self._temperature_unit = UnitOfTemperature.CELSIUS
         self._supported_features = (
             ClimateEntityFeature.TURN_ON |
@@ -54,10 +86,6 @@ class GrentonClimate(ClimateEntity):
     def name(self):
         return self._name
 
-    @property
-    def should_poll(self):
-        return True
-
     @property
     def temperature_unit(self):
         return self._temperature_unit
@@ -86,54 +114,38 @@ class GrentonClimate(ClimateEntity):
     def supported_features(self):
         return self._supported_features
 
-    def set_temperature(self, **kwargs):
+    async def async_set_temperature(self, **kwargs):
         try:
             temperature = kwargs.get("temperature", 20)
             self._target_temperature = temperature
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(8, 0)')"}
-            command.update({"command_2": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(3, {temperature})')"})
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-        except requests.RequestException as ex:
+            command = {"command": self._grenton_object.set(8, 0)}
+            command.update({"command_2": self._grenton_object.set(3, temperature)})
+            await self._async_command(command, "temperature")
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to set the climate temperature: {ex}")
 
-    def set_hvac_mode(self, hvac_mode):
+    async def async_set_hvac_mode(self, hvac_mode):
         try:
             self._hvac_mode = hvac_mode
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(1, 0)')"}
+            command = {"command": self._grenton_object.execute(1, 0)}
             if hvac_mode == HVACMode.HEAT:
-                command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(0, 0)')"}
-                command.update({"command_2": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(7, 0)')"})
+                command = {"command": self._grenton_object.execute(0, 0)}
+                command.update({"command_2": self._grenton_object.set(7, 0)})
             elif hvac_mode == HVACMode.COOL:
-                command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(0, 0)')"}
-                command.update({"command_2": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(7, 1)')"})
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-        except requests.RequestException as ex:
+                command = {"command": self._grenton_object.execute(0, 0)}
+                command.update({"command_2": self._grenton_object.set(7, 1)})
+            await self._async_command(command, "mode")
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to set the climate hvac_mode: {ex}")
-        
 
-    def update(self):
-        try:
-            command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(6)')"}
-            command.update({"status_2": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(7)')"})
-            command.update({"status_3": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(12)')"})
-            command.update({"status_4": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(14)')"})
-            response = requests.get(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-            data = response.json()
-            self._hvac_mode = HVACMode.OFF if data.get("status") == 0 else (HVACMode.COOL if data.get("status_2") == 1 else HVACMode.HEAT)
-            self._target_temperature = data.get("status_3")
-            self._current_temperature = data.get("status_4")
-        except requests.RequestException as ex:
-            _LOGGER.error(f"Failed to update the climate state: {ex}")
-            self._state = None
+    def _status_schema(self):
+        return STATUS_SCHEMA
+
+    def _update_from_status(self, data):
+        enabled = data.get("enabled")
+        if enabled is not None:
+            self._hvac_mode = HVACMode.OFF if not enabled else (HVACMode.COOL if data.get("mode") == 1 else HVACMode.HEAT)
+        if "target_temperature" in data:
+            self._target_temperature = data["target_temperature"]
+        if "current_temperature" in data:
+            self._current_temperature = data["current_temperature"]
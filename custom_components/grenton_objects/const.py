@@ -0,0 +1,32 @@
+"""Constants for the Grenton objects integration."""
+DOMAIN = 'grenton_objects'
+
+CONF_WEBHOOK_ID = 'webhook_id'
+CONF_RECONCILE_INTERVAL = 'reconcile_interval'
+CONF_AGGREGATE_READS = 'aggregate_reads'
+CONF_SCAN_INTERVAL = 'scan_interval'
+CONF_MAX_SCAN_INTERVAL = 'max_scan_interval'
+CONF_SLOW_SCAN_INTERVAL = 'slow_scan_interval'
+CONF_CONNECT_TIMEOUT = 'connect_timeout'
+CONF_READ_TIMEOUT = 'read_timeout'
+CONF_STARTUP_BATCH_SIZE = 'startup_batch_size'
+CONF_MAX_IN_FLIGHT = 'max_in_flight'
+CONF_SPLIT_BY_CLU = 'split_by_clu'
+CONF_COMPACT_READS = 'compact_reads'
+CONF_BULK_VARIABLES = 'bulk_variables'
+CONF_VERSION_VARIABLE = 'version_variable'
+CONF_DISCOVERY = 'discovery'
+CONF_API_ENDPOINT = 'api_endpoint'
+CONF_CLUS = 'clus'
+CONF_FAMILIES = 'families'
+CONF_EXCLUDE = 'exclude'
+CONF_GATEWAYS = 'gateways'
+CONF_FALLBACK_ENDPOINTS = 'fallback_endpoints'
+
+DATA_CONFIG = 'config'
+DATA_COORDINATORS = 'coordinators'
+DATA_OBJECTS = 'objects'
+DATA_HASS_CONFIG = 'hass_config'
+DATA_STATE_CACHE = 'state_cache'
+
+SERVICE_DUMP_DIAGNOSTICS = 'dump_diagnostics'
@@ -0,0 +1,542 @@
+"""Grenton objects polling coordinator."""
+import aiohttp
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from homeassistant.core import callback, split_entity_id
+from homeassistant.const import Platform
+from homeassistant.helpers import discovery
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.update_coordinator import (
+    DataUpdateCoordinator,
+    UpdateFailed
+)
+from .client import (
+    GrentonClient,
+    GrentonUnavailableError,
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    MAX_IN_FLIGHT
+)
+from .scheduler import GrentonPollScheduler
+from .const import (
+    DOMAIN,
+    CONF_WEBHOOK_ID,
+    CONF_RECONCILE_INTERVAL,
+    CONF_AGGREGATE_READS,
+    CONF_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_SLOW_SCAN_INTERVAL,
+    CONF_CONNECT_TIMEOUT,
+    CONF_READ_TIMEOUT,
+    CONF_STARTUP_BATCH_SIZE,
+    CONF_MAX_IN_FLIGHT,
+    CONF_SPLIT_BY_CLU,
+    CONF_COMPACT_READS,
+    CONF_BULK_VARIABLES,
+    CONF_VERSION_VARIABLE,
+    CONF_GATEWAYS,
+    CONF_API_ENDPOINT,
+    CONF_FALLBACK_ENDPOINTS,
+    DATA_CONFIG,
+    DATA_COORDINATORS,
+    DATA_HASS_CONFIG
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+SCAN_INTERVAL = timedelta(seconds=30)
+MAX_SCAN_INTERVAL = timedelta(seconds=120)
+SLOW_SCAN_INTERVAL = timedelta(minutes=15)
+MIN_REFRESH_INTERVAL = 0.5
+REQUEST_REFRESH_COOLDOWN = 0.5
+AGGREGATE_CHUNK_SIZE = 40
+AGGREGATE_SEPARATOR = ';'
+STARTUP_BATCH_SIZE = 40
+# Startup read order, lower values are read first.
+PRIORITY_HIGH = 0
+DEFAULT_PRIORITY = 1
+PRIORITY_LOW = 2
+
+def build_concat_expression(expressions):
+    values = ", ".join(f"tostring({expression})" for expression in expressions)
+    return f"return table.concat({{{values}}}, \"{AGGREGATE_SEPARATOR}\")"
+
+def build_aggregate_command(clu_id, expressions):
+    return f"return {clu_id}:execute(0, '{build_concat_expression(expressions)}')"
+
+def build_variables_command(clu_id, expressions, version_variable=None, version=None):
+    # With a version variable its value comes first. When it still equals
+    # the version of the last snapshot only the version is returned.
+    if version_variable is not None:
+        expressions = [f"getVar(\"{version_variable}\")", *expressions]
+    code = build_concat_expression(expressions)
+    if version is not None:
+        code = f"if tostring(getVar(\"{version_variable}\")) == \"{version}\" then return \"{version}\" end {code}"
+    if clu_id is None:
+        return code
+    return f"return {clu_id}:execute(0, '{code}')"
+
+def decode_aggregate_value(value):
+    if value == "nil":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def get_coordinator(hass, api_endpoint):
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    coordinators = domain_data.setdefault(DATA_COORDINATORS, {})
+    config = domain_data.get(DATA_CONFIG, {})
+    # Entities may name any Gate of a redundant set, they all share the
+    # coordinator of its primary Gate.
+    fallback_endpoints = ()
+    for gateway in config.get(CONF_GATEWAYS, []):
+        if api_endpoint == gateway[CONF_API_ENDPOINT] or api_endpoint in gateway[CONF_FALLBACK_ENDPOINTS]:
+            api_endpoint = gateway[CONF_API_ENDPOINT]
+            fallback_endpoints = gateway[CONF_FALLBACK_ENDPOINTS]
+            break
+    if api_endpoint not in coordinators:
+        # With push updates enabled polling only reconciles missed events.
+        scan_interval = config.get(CONF_SCAN_INTERVAL, SCAN_INTERVAL)
+        max_scan_interval = config.get(CONF_MAX_SCAN_INTERVAL, MAX_SCAN_INTERVAL)
+        if config.get(CONF_WEBHOOK_ID):
+            scan_interval = config[CONF_RECONCILE_INTERVAL]
+            max_scan_interval = max(max_scan_interval, scan_interval)
+        coordinators[api_endpoint] = GrentonCoordinator(
+            hass,
+            GrentonClient(
+                hass,
+                api_endpoint,
+                config.get(CONF_CONNECT_TIMEOUT, CONNECT_TIMEOUT),
+                config.get(CONF_READ_TIMEOUT, READ_TIMEOUT),
+                config.get(CONF_MAX_IN_FLIGHT, MAX_IN_FLIGHT),
+                config.get(CONF_SPLIT_BY_CLU, False),
+                fallback_endpoints
+            ),
+            scan_interval,
+            max_scan_interval,
+            config.get(CONF_AGGREGATE_READS, False),
+            config.get(CONF_STARTUP_BATCH_SIZE, STARTUP_BATCH_SIZE),
+            config.get(CONF_COMPACT_READS, False),
+            config.get(CONF_SLOW_SCAN_INTERVAL, SLOW_SCAN_INTERVAL),
+            config.get(CONF_BULK_VARIABLES, False),
+            config.get(CONF_VERSION_VARIABLE)
+        )
+        # Request metrics of every Gate are exposed as diagnostic sensors.
+        hass.async_create_task(
+            discovery.async_load_platform(
+                hass,
+                Platform.SENSOR,
+                DOMAIN,
+                {"api_endpoint": api_endpoint},
+                domain_data.get(DATA_HASS_CONFIG, {})
+            )
+        )
+    return coordinators[api_endpoint]
+
+class GrentonCoordinator(DataUpdateCoordinator):
+    def __init__(self, hass, client, scan_interval=SCAN_INTERVAL, max_scan_interval=MAX_SCAN_INTERVAL, aggregate_reads=False, startup_batch_size=STARTUP_BATCH_SIZE, compact_reads=False, slow_scan_interval=SLOW_SCAN_INTERVAL, bulk_variables=False, version_variable=None):
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"{DOMAIN} {client.api_endpoint}",
+            update_interval=scan_interval,
+            request_refresh_debouncer=Debouncer(
+                hass, _LOGGER, cooldown=REQUEST_REFRESH_COOLDOWN, immediate=False
+            )
+        )
+        self._client = client
+        self._scan_interval = scan_interval
+        self._aggregate_reads = aggregate_reads
+        self._startup_batch_size = startup_batch_size
+        self._compact_reads = compact_reads
+        self._slow_scan_interval = slow_scan_interval
+        self._bulk_variables = bulk_variables
+        self._version_variable = version_variable
+        self._variables = {}
+        self._variable_versions = {}
+        self._scheduler = GrentonPollScheduler(scan_interval, max_scan_interval)
+        self._commands = {}
+        self._features = {}
+        self._schemas = {}
+        self._fast_polls = {}
+        self._push_targets = {}
+        self._deadbands = {}
+        self._reported = {}
+        self._changed = set()
+        self._priorities = {}
+        self._unread = set()
+        self._clus = {}
+        self._references = {}
+        client.add_availability_listener(self._async_availability_changed)
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def slow_scan_interval(self):
+        return self._slow_scan_interval
+
+    @callback
+    def _async_availability_changed(self, available):
+        # A dead Gate marks all of its entities unavailable at once, after
+        # recovery every entity is read again.
+        if available:
+            for key in self._commands:
+                self._scheduler.mark_due(key)
+            self.hass.async_create_task(self.async_request_refresh())
+        else:
+            self.async_set_update_error(GrentonUnavailableError(f"Gate {self._client.api_endpoint} is unavailable"))
+
+    def register(self, key, command, grenton_object=None, schema=None, fast_poll=None, deadband=0, priority=DEFAULT_PRIORITY, scan_interval=None, ttl=None, primary=True):
+        # Several entities may share a key, e.g. the values of one meter,
+        # it is kept until the last of them unregisters.
+        self._references[key] = self._references.get(key, 0) + 1
+        if self._references[key] > 1:
+            return
+        features = schema.features if schema is not None else {}
+        self._commands[key] = command
+        self._scheduler.add(key, scan_interval, ttl)
+        self._priorities[key] = priority
+        self._unread.add(key)
+        if deadband:
+            self._deadbands[key] = deadband
+        if fast_poll is not None:
+            self._fast_polls[key] = fast_poll
+        if schema is not None:
+            self._schemas[key] = schema
+        if grenton_object is not None and features:
+            self._features[key] = (grenton_object, features)
+        if grenton_object is not None and grenton_object.is_user_feature and not features:
+            self._variables[key] = grenton_object
+        if grenton_object is not None:
+            self._clus[key] = grenton_object.clu_id
+            push_features = {str(index): status_key for status_key, index in features.items()}
+            self._push_targets.setdefault(grenton_object.grenton_id, {})[key] = (push_features, primary)
+
+    def unregister(self, key):
+        self._references[key] = self._references.get(key, 1) - 1
+        if self._references[key] > 0:
+            return
+        self._references.pop(key)
+        self._commands.pop(key, None)
+        self._features.pop(key, None)
+        self._schemas.pop(key, None)
+        self._fast_polls.pop(key, None)
+        self._deadbands.pop(key, None)
+        self._priorities.pop(key, None)
+        self._clus.pop(key, None)
+        self._variables.pop(key, None)
+        self._variable_versions.pop(key, None)
+        self._unread.discard(key)
+        self._reported.pop(key, None)
+        self._changed.discard(key)
+        self._scheduler.remove(key)
+        for targets in self._push_targets.values():
+            targets.pop(key, None)
+
+    def mark_due(self, key):
+        self._scheduler.mark_due(key)
+
+    def has_changed(self, key):
+        return key in self._changed
+
+    def _values_changed(self, key, values):
+        # Values are compared with the last reported ones, not the last
+        # polled ones, so a slow drift within the deadband still adds up
+        # to a change eventually.
+        reported = self._reported.get(key)
+        if reported is None:
+            return True
+        deadband = self._deadbands.get(key, 0)
+        for status_key in values.keys() | reported.keys():
+            value = values.get(status_key)
+            previous = reported.get(status_key)
+            if (
+                deadband
+                and isinstance(value, (int, float))
+                and isinstance(previous, (int, float))
+                and not isinstance(value, bool)
+            ):
+                if abs(value - previous) > deadband:
+                    return True
+            elif value != previous:
+                return True
+        return False
+
+    def _detect_changes(self, results, now):
+        changed = set()
+        for key, values in results.items():
+            self._unread.discard(key)
+            if self._values_changed(key, values):
+                self._reported[key] = values
+                changed.add(key)
+            self._report(key, key in changed, values, now)
+        self._changed = changed
+
+    def diagnostics(self):
+        return {
+            "available": self._client.available,
+            "gateways": {gateway.api_endpoint: gateway.as_dict() for gateway in self._client.gateways},
+            "last_update_success": self.last_update_success,
+            "update_interval": self.update_interval.total_seconds() if self.update_interval else None,
+            "aggregate_reads": self._aggregate_reads,
+            "compact_reads": self._compact_reads,
+            "bulk_variables": self._bulk_variables,
+            "variable_versions": dict(self._variable_versions),
+            "entities": sorted(self._commands),
+            "metrics": self._client.metrics.as_dict()
+        }
+
+    def _report(self, key, changed, values, now):
+        fast_poll = self._fast_polls.get(key)
+        self._scheduler.report(key, changed, now, fast_poll(values) if fast_poll else None)
+
+    def _schedule_next_refresh(self, now):
+        next_due = self._scheduler.next_due()
+        if next_due is None:
+            self.update_interval = self._scan_interval
+        else:
+            self.update_interval = timedelta(seconds=max(next_due - now, MIN_REFRESH_INTERVAL))
+
+    @callback
+    def async_push(self, updates):
+        now = time.monotonic()
+        data = dict(self.data or {})
+        handled = set()
+        results = {}
+        for grenton_id, value in updates.items():
+            for key, (push_features, primary) in self._push_targets.get(grenton_id, {}).items():
+                raw = {}
+                if isinstance(value, dict):
+                    for index, feature_value in value.items():
+                        status_key = push_features.get(str(index))
+                        if status_key is not None:
+                            raw[status_key] = feature_value
+                elif primary:
+                    # Only the key holding the main feature takes a single
+                    # value, other keys of a split entity number their
+                    # fields from "status" as well.
+                    raw["status"] = value
+                if not raw:
+                    continue
+                values = dict(data.get(key, {}))
+                values.update(self._decode(key, raw, partial=True))
+                data[key] = values
+                results[key] = values
+                handled.add(grenton_id)
+        if handled:
+            self._detect_changes(results, now)
+            self._schedule_next_refresh(now)
+            self.async_set_updated_data(data)
+        return handled
+
+    def _decode(self, key, values, partial=False):
+        schema = self._schemas.get(key)
+        return schema.decode(values, partial) if schema is not None else values
+
+    def _build_request(self, keys):
+        # The HAlistener script only accepts a payload with a "status" key,
+        # the remaining expressions are numbered status_2, status_3, ...
+        payload = {}
+        mapping = {}
+
+        def add(value, targets, aggregated=False, versioned=False):
+            batch_key = "status" if not payload else f"status_{len(payload) + 1}"
+            payload[batch_key] = value
+            mapping[batch_key] = (targets, aggregated, versioned)
+
+        # In aggregate mode all object features of one CLU are read by a
+        # single execute call returning a delimited string. Compact reads
+        # keep one execute call per feature but return all of them as one
+        # delimited string instead of a JSON key each.
+        aggregated_reads = {}
+        compact_reads = []
+        variable_reads = {}
+        for key in keys:
+            command = self._commands[key]
+            if key in self._variables and self._bulk_variables:
+                grenton_object = self._variables[key]
+                variable_reads.setdefault(grenton_object.clu_id, []).append(
+                    ((key, "status"), grenton_object.get_var_expression())
+                )
+            elif key in self._features and (self._aggregate_reads or self._compact_reads):
+                grenton_object, features = self._features[key]
+                for status_key, index in features.items():
+                    if self._aggregate_reads:
+                        aggregated_reads.setdefault(grenton_object.clu_id, []).append(
+                            ((key, status_key), grenton_object.get_expression(index))
+                        )
+                    else:
+                        compact_reads.append(((key, status_key), grenton_object.remote_get(index)))
+                # Values that are not object features, e.g. a variable read
+                # along with the object, keep their own expression.
+                for status_key, value in command.items():
+                    if status_key not in features:
+                        add(value, [(key, status_key)])
+            else:
+                for status_key, value in command.items():
+                    add(value, [(key, status_key)])
+        for start in range(0, len(compact_reads), AGGREGATE_CHUNK_SIZE):
+            chunk = compact_reads[start:start + AGGREGATE_CHUNK_SIZE]
+            add(
+                build_concat_expression([expression for _, expression in chunk]),
+                [target for target, _ in chunk],
+                True
+            )
+        for clu_id, reads in aggregated_reads.items():
+            for start in range(0, len(reads), AGGREGATE_CHUNK_SIZE):
+                chunk = reads[start:start + AGGREGATE_CHUNK_SIZE]
+                add(
+                    build_aggregate_command(clu_id, [expression for _, expression in chunk]),
+                    [target for target, _ in chunk],
+                    True
+                )
+        # Variables are read per CLU, or on the Gate itself, by a single
+        # expression. The version check is only sent when all variables of
+        # the chunk were read at the same version.
+        versioned = self._version_variable is not None
+        for clu_id, reads in variable_reads.items():
+            for start in range(0, len(reads), AGGREGATE_CHUNK_SIZE):
+                chunk = reads[start:start + AGGREGATE_CHUNK_SIZE]
+                versions = {self._variable_versions.get(key) for (key, _), _ in chunk}
+                version = versions.pop() if versioned and len(versions) == 1 else None
+                add(
+                    build_variables_command(
+                        clu_id,
+                        [expression for _, expression in chunk],
+                        self._version_variable,
+                        version
+                    ),
+                    [target for target, _ in chunk],
+                    True,
+                    versioned
+                )
+        return payload, mapping
+
+    def _with_variable_snapshots(self, keys):
+        # With a version variable all variables of a CLU are read together,
+        # so they stay at the same version and the check can be sent.
+        clu_ids = {self._variables[key].clu_id for key in keys if key in self._variables}
+        if not clu_ids:
+            return keys
+        due = set(keys)
+        return keys + [
+            key for key, grenton_object in self._variables.items()
+            if grenton_object.clu_id in clu_ids and key not in due
+        ]
+
+    def _plan_batches(self, keys):
+        # Objects that were never read, e.g. after a restart, are read in
+        # priority order in batches of startup_batch_size with at most
+        # max_in_flight batches per refresh. The rest stays due for the
+        # following refreshes instead of hitting the Gate all at once.
+        regular = [key for key in keys if key not in self._unread]
+        unread = sorted(
+            (key for key in keys if key in self._unread),
+            key=lambda key: self._priorities.get(key, DEFAULT_PRIORITY)
+        )
+        size = self._startup_batch_size
+        unread = unread[:size * self._client.max_in_flight]
+        batches = [unread[start:start + size] for start in range(0, len(unread), size)]
+        if regular:
+            if batches:
+                batches[0] = regular + batches[0]
+            else:
+                batches.append(regular)
+        if not self._client.split_by_clu:
+            return [(None, batch) for batch in batches]
+        # Each CLU gets its own request so a slow CLU does not hold up the
+        # objects of the others.
+        split = []
+        for batch in batches:
+            groups = {}
+            for key in batch:
+                groups.setdefault(self._clus.get(key), []).append(key)
+            split.extend(groups.items())
+        return split
+
+    async def _async_read(self, keys, clu_id=None):
+        payload, mapping = self._build_request(keys)
+        if not payload:
+            return {}
+        data = await self._client.get(payload, {split_entity_id(key)[0] for key in keys}, clu_id)
+        result = {}
+        unchanged = []
+        for batch_key, (targets, aggregated, versioned) in mapping.items():
+            value = data.get(batch_key)
+            if aggregated:
+                values = value.split(AGGREGATE_SEPARATOR) if isinstance(value, str) else []
+            else:
+                values = [value]
+            if versioned:
+                # A snapshot that only holds the version did not change.
+                version, values = (values[0], values[1:]) if values else (None, [])
+                version = None if version == "nil" else version
+                if version is not None and not values:
+                    unchanged.extend(key for key, _ in targets)
+                    continue
+                for key, _ in targets:
+                    self._variable_versions[key] = version
+            if aggregated:
+                values = [decode_aggregate_value(item) for item in values]
+            for position, (key, status_key) in enumerate(targets):
+                result.setdefault(key, {})[status_key] = values[position] if position < len(values) else None
+        decoded = {key: self._decode(key, values) for key, values in result.items()}
+        previous = self.data or {}
+        for key in unchanged:
+            if key in previous:
+                decoded[key] = previous[key]
+        return decoded
+
+    async def _async_update_data(self):
+        now = time.monotonic()
+        previous = self.data or {}
+        keys = [key for key in self._scheduler.due_keys(now) if key in self._commands]
+        if self._bulk_variables and self._version_variable is not None:
+            keys = self._with_variable_snapshots(keys)
+        batches = self._plan_batches(keys)
+        if not batches:
+            self._changed = set()
+            self._schedule_next_refresh(now)
+            return previous
+        responses = await asyncio.gather(
+            *(self._async_read(batch, clu_id) for clu_id, batch in batches),
+            return_exceptions=True
+        )
+        result = {}
+        errors = []
+        failed = []
+        for (_, batch), response in zip(batches, responses):
+            if isinstance(response, aiohttp.ClientError):
+                errors.append(response)
+                failed.extend(batch)
+            elif isinstance(response, BaseException):
+                raise response
+            else:
+                result.update(response)
+        if len(errors) == len(responses):
+            self._changed = set()
+            self.update_interval = self._scan_interval
+            raise UpdateFailed(f"Failed to update Grenton objects: {errors[0]}") from errors[0]
+
+        now = time.monotonic()
+        if errors:
+            # Objects of a failed batch are read again after the base
+            # interval, the rest of the refresh is kept.
+            _LOGGER.warning(f"Failed to read {len(failed)} Grenton objects: {errors[0]}")
+            for key in failed:
+                self._scheduler.postpone(key, now)
+        self._detect_changes(result, now)
+        self._schedule_next_refresh(now)
+        merged = {key: values for key, values in previous.items() if key in self._commands}
+        merged.update(result)
+        return merged
@@ -1,7 +1,10 @@
-import requests
+import aiohttp
 import logging
 import json
+import time
 import voluptuous as vol
+import homeassistant.helpers.config_validation as cv
+from datetime import timedelta
 from homeassistant.components.cover import (
     CoverEntity,
     PLATFORM_SCHEMA,
@@ -13,6 +16,17 @@ from homeassistant.const import (
     STATE_OPEN,
     STATE_OPENING
 )
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+from .coordinator import get_coordinator, PRIORITY_HIGH
+from .decoder import (
+    GrentonStatusSchema,
+    decode_int,
+    decode_number,
+    scaled
+)
+from .entity import GrentonEntity, GrentonGroupMixin
+from .objects import get_object_ref, same_clu
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -20,35 +34,97 @@ DOMAIN = 'grenton_objects'
 
 CONF_API_ENDPOINT = 'api_endpoint'
 CONF_GRENTON_ID = 'grenton_id'
+CONF_GRENTON_IDS = 'grenton_ids'
 CONF_OBJECT_NAME = 'name'
 CONF_REVERSED = 'reversed'
+CONF_OPENING_TIME = 'opening_time'
+CONF_CLOSING_TIME = 'closing_time'
+
+MOVING_SCAN_INTERVAL = 1
+END_OF_TRAVEL_MARGIN = 1
+MIN_LEARNING_DISTANCE = 10
+# A travel time is only learned when the stop was seen within this many
+# seconds of the last read that still saw the motion, not from the late
+# poll scheduled after the expected end.
+MAX_LEARNING_GAP = 2 * MOVING_SCAN_INTERVAL
+TRAVEL_UPDATE_INTERVAL = timedelta(seconds=1)
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
-    vol.Required(CONF_API_ENDPOINT): str,
-    vol.Required(CONF_GRENTON_ID): str,
-    vol.Required(CONF_REVERSED, default=False): bool,
-    vol.Optional(CONF_OBJECT_NAME, default='Grenton Cover'): str
+# Tilt is reported in degrees 0-90.
+STATUS_SCHEMA = GrentonStatusSchema({
+    "motion": (0, decode_int),
+    "position": (7, decode_number),
+    "tilt": (8, scaled(100 / 90))
+})
+ZWAVE_STATUS_SCHEMA = GrentonStatusSchema({
+    "motion": (2, decode_int),
+    "position": (4, decode_number),
+    "tilt": (6, scaled(100 / 90))
 })
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
+PLATFORM_SCHEMA = vol.All(
+    cv.has_at_least_one_key(CONF_GRENTON_ID, CONF_GRENTON_IDS),
+    PLATFORM_SCHEMA.extend({
+        vol.Required(CONF_API_ENDPOINT): str,
+        vol.Exclusive(CONF_GRENTON_ID, 'grenton_object'): str,
+        vol.Exclusive(CONF_GRENTON_IDS, 'grenton_object'): vol.All(cv.ensure_list, [str], vol.Length(min=2), same_clu),
+        vol.Required(CONF_REVERSED, default=False): bool,
+        vol.Optional(CONF_OPENING_TIME): vol.All(vol.Coerce(float), vol.Range(min=1)),
+        vol.Optional(CONF_CLOSING_TIME): vol.All(vol.Coerce(float), vol.Range(min=1)),
+        vol.Optional(CONF_OBJECT_NAME, default='Grenton Cover'): str
+    })
+)
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    if discovery_info is not None:
+        api_endpoint = discovery_info[CONF_API_ENDPOINT]
+        coordinator = get_coordinator(hass, api_endpoint)
+        async_add_entities([
+            GrentonCover(coordinator, api_endpoint, get_object_ref(hass, grenton_id), False, grenton_id)
+            for grenton_id in discovery_info["grenton_ids"]
+        ])
+        return
+
     api_endpoint = config.get(CONF_API_ENDPOINT)
     grenton_id = config.get(CONF_GRENTON_ID)
+    grenton_ids = config.get(CONF_GRENTON_IDS)
     reversed = config.get(CONF_REVERSED)
+    opening_time = config.get(CONF_OPENING_TIME)
+    closing_time = config.get(CONF_CLOSING_TIME)
     object_name = config.get(CONF_OBJECT_NAME)
 
-    add_entities([GrentonCover(api_endpoint, grenton_id, reversed, object_name)], True)
+    coordinator = get_coordinator(hass, api_endpoint)
+
+    if grenton_ids:
+        grenton_objects = [get_object_ref(hass, grenton_id) for grenton_id in grenton_ids]
+        async_add_entities([GrentonCoverGroup(coordinator, api_endpoint, grenton_objects, reversed, object_name, opening_time, closing_time)])
+        return
+
+    grenton_object = get_object_ref(hass, grenton_id)
+
+    async_add_entities([GrentonCover(coordinator, api_endpoint, grenton_object, reversed, object_name, opening_time, closing_time)])
 
-class GrentonCover(CoverEntity):
-    def __init__(self, api_endpoint, grenton_id, reversed, object_name):
+class GrentonCover(GrentonEntity, CoverEntity):
+    _refresh_priority = PRIORITY_HIGH
+
+    def __init__(self, coordinator, api_endpoint, grenton_object, reversed, object_name, opening_time=None, closing_time=None):
+        super().__init__(coordinator)
         self._device_class = CoverDeviceClass.BLIND
         self._api_endpoint = api_endpoint
-        self._grenton_id = grenton_id
+        self._grenton_object = grenton_object
         self._reversed = reversed
         self._object_name = object_name
         self._state = None
         self._current_cover_position = None
         self._current_cover_tilt_position = None
-        self._unique_id = f"grenton_{grenton_id.split('->')[1]}"
+        self._unique_id = f"grenton_{grenton_object.object_id}"
+        self._configured_travel_times = {STATE_OPENING: opening_time, STATE_CLOSING: closing_time}
+        self._learned_travel_times = {}
+        self._target_position = None
+        self._travel_state = None
+        self._travel_start = None
+        self._travel_start_position = None
+        self._motion_seen_at = None
+        self._cancel_travel_update = None
 
     @property
     def name(self):
@@ -68,6 +144,9 @@ class GrentonCover(CoverEntity):
 
     @property
     def current_cover_position(self):
+        position = self._interpolated_position()
+        if position is not None:
+            return position
         return self._current_cover_position
     
     @property
@@ -78,141 +157,222 @@ class GrentonCover(CoverEntity):
     def unique_id(self):
         return self._unique_id
 
-    def open_cover(self, **kwargs):
+    async def async_open_cover(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(0, 0)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
+            command = self._build_command(lambda grenton_object: [grenton_object.execute_expression(0, 0)])
             self._state = STATE_OPENING
-        except requests.RequestException as ex:
+            self._target_position = None
+            self._start_travel(STATE_OPENING)
+            await self._async_command(command)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to open the cover: {ex}")
 
-    def close_cover(self, **kwargs):
+    async def async_close_cover(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(1, 0)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
+            command = self._build_command(lambda grenton_object: [grenton_object.execute_expression(1, 0)])
             self._state = STATE_CLOSING
-        except requests.RequestException as ex:
+            self._target_position = None
+            self._start_travel(STATE_CLOSING)
+            await self._async_command(command)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to close the cover: {ex}")
 
-    def stop_cover(self, **kwargs):
+    async def async_stop_cover(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(3, 0)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
+            command = self._build_command(lambda grenton_object: [grenton_object.execute_expression(3, 0)])
+            position = self._interpolated_position()
+            if position is not None:
+                self._current_cover_position = position
             self._state = STATE_OPEN
-        except requests.RequestException as ex:
+            self._target_position = None
+            self._stop_travel()
+            await self._async_command(command)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to stop the cover: {ex}")
 
-    def set_cover_position(self, **kwargs):
+    async def async_set_cover_position(self, **kwargs):
         try:
             position = kwargs.get("position", 100)
-            self._current_cover_position = position
+            previous_position = self.current_cover_position
+            if previous_position is None or position > previous_position:
+                self._state = STATE_OPENING
+            elif position < previous_position:
+                self._state = STATE_CLOSING
+            self._target_position = position
+            if self._state in (STATE_OPENING, STATE_CLOSING) and self._travel_time(self._state) is not None:
+                self._start_travel(self._state)
+            else:
+                self._current_cover_position = position
             if self._reversed == True:
                 position = 100 - position
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(10, {position})')"}
-            if self._grenton_id.split('->')[1].startswith("ZWA"):
-                command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(7, {position})')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
+            command = self._build_command(
+                lambda grenton_object: [grenton_object.execute_expression(7 if grenton_object.is_zwave else 10, position)]
             )
-            response.raise_for_status()
-            if (position > self._current_cover_position):
-                if self._reversed == True:
-                    self._state = STATE_CLOSING
-                else:
-                    self._state = STATE_OPENING
-            else:
-                if self._reversed == True:
-                    self._state = STATE_OPENING
-                else:
-                    self._state = STATE_CLOSING
-        except requests.RequestException as ex:
+            await self._async_command(command)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to set the cover position: {ex}")
 
-    def set_cover_tilt_position(self, **kwargs):
+    async def async_set_cover_tilt_position(self, **kwargs):
         try:
             tilt_position = kwargs.get("tilt_position", 90)
             self._current_cover_tilt_position = tilt_position
             tilt_position = tilt_position * 90 / 100
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(9, {tilt_position})')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-        except requests.RequestException as ex:
+            command = self._build_command(lambda grenton_object: [grenton_object.execute_expression(9, tilt_position)])
+            await self._async_command(command, "tilt")
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to set the cover tilt position: {ex}")
 
-    def open_cover_tilt(self, **kwargs):
+    async def async_open_cover_tilt(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(9, 90)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-        except requests.RequestException as ex:
+            command = self._build_command(lambda grenton_object: [grenton_object.execute_expression(9, 90)])
+            self._current_cover_tilt_position = 100
+            await self._async_command(command, "tilt")
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to open the cover tilt: {ex}")
 
-    def close_cover_tilt(self, **kwargs):
+    async def async_close_cover_tilt(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(9, 0)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-        except requests.RequestException as ex:
+            command = self._build_command(lambda grenton_object: [grenton_object.execute_expression(9, 0)])
+            self._current_cover_tilt_position = 0
+            await self._async_command(command, "tilt")
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to close the cover tilt: {ex}")
 
-    def update(self):
-        try:
-            if self._grenton_id.split('->')[1].startswith("ZWA"):
-                command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(2)')"}
-            else:
-                command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(0)')"}
-            if self._grenton_id.split('->')[1].startswith("ZWA"):
-                command.update({"status_2": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(4)')"})
-            else:
-                command.update({"status_2": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(7)')"})
-            if self._grenton_id.split('->')[1].startswith("ZWA"):
-                command.update({"status_3": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(6)')"})
-            else:
-                command.update({"status_3": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(8)')"})
-            response = requests.get(
-                f"{self._api_endpoint}",
-                json = command
+    def _status_schema(self):
+        return ZWAVE_STATUS_SCHEMA if self._grenton_object.is_zwave else STATUS_SCHEMA
+
+    def _motion_state(self, status):
+        if status == 1:
+            return STATE_CLOSING if self._reversed == True else STATE_OPENING
+        if status == 2:
+            return STATE_OPENING if self._reversed == True else STATE_CLOSING
+        return None
+
+    def _travel_time(self, state):
+        return self._configured_travel_times.get(state) or self._learned_travel_times.get(state)
+
+    def _fast_poll_interval(self, data):
+        # With a known travel time the Gate is only asked again when the
+        # motion is expected to end, otherwise poll every second.
+        state = self._motion_state(data.get("motion"))
+        if state is None:
+            return None
+        travel_time = self._travel_time(state)
+        position = data.get("position")
+        if travel_time is None or position is None:
+            return MOVING_SCAN_INTERVAL
+        if self._reversed == True:
+            position = 100 - position
+        target = self._target_position
+        if target is None:
+            target = 100 if state == STATE_OPENING else 0
+        return max(abs(target - position) * travel_time / 100, MOVING_SCAN_INTERVAL) + END_OF_TRAVEL_MARGIN
+
+    def _interpolated_position(self):
+        if self._travel_start is None or self._travel_start_position is None:
+            return None
+        travel_time = self._travel_time(self._travel_state)
+        if travel_time is None:
+            return None
+        distance = (time.monotonic() - self._travel_start) * 100 / travel_time
+        if self._travel_state == STATE_OPENING:
+            position = min(self._travel_start_position + distance, 100)
+            if self._target_position is not None:
+                position = min(position, self._target_position)
+        else:
+            position = max(self._travel_start_position - distance, 0)
+            if self._target_position is not None:
+                position = max(position, self._target_position)
+        return round(position)
+
+    @callback
+    def _start_travel(self, state):
+        if self._travel_state == state and self._travel_start is not None:
+            return
+        position = self._interpolated_position()
+        self._travel_start_position = position if position is not None else self._current_cover_position
+        self._travel_state = state
+        self._travel_start = time.monotonic()
+        if self._cancel_travel_update is None and self._travel_time(state) is not None:
+            self._cancel_travel_update = async_track_time_interval(
+                self.hass, self._async_travel_update, TRAVEL_UPDATE_INTERVAL
             )
-            response.raise_for_status()
-            data = response.json()
-            self._state = STATE_CLOSED if data.get("status_2") == 0 else STATE_OPEN
-            if data.get("status") == 1:
-                if self._reversed == True:
-                    self._state = STATE_CLOSING
-                else:
-                    self._state = STATE_OPENING
-            elif data.get("status") == 2:
-                if self._reversed == True:
-                    self._state = STATE_OPENING
-                else:
-                    self._state = STATE_CLOSING
-            temp_position = data.get("status_2")
-            if self._reversed == True:
-                temp_position = 100 - temp_position
-            self._current_cover_position = temp_position
-            self._current_cover_tilt_position = data.get("status_3") * 100 / 90
-        except requests.RequestException as ex:
-            _LOGGER.error(f"Failed to update the cover state: {ex}")
-            self._state = None
+
+    @callback
+    def _stop_travel(self, end_position=None):
+        now = time.monotonic()
+        if (
+            self._travel_start is not None
+            and end_position is not None
+            and self._travel_start_position is not None
+            and self._motion_seen_at is not None
+            and now - self._motion_seen_at <= MAX_LEARNING_GAP
+        ):
+            # Learn the full travel time from the observed motion unless it
+            # was configured explicitly. The motion ended between the last
+            # read that saw it and this one.
+            distance = abs(end_position - self._travel_start_position)
+            if distance >= MIN_LEARNING_DISTANCE and self._configured_travel_times.get(self._travel_state) is None:
+                travel_time = ((self._motion_seen_at + now) / 2 - self._travel_start) * 100 / distance
+                learned = self._learned_travel_times.get(self._travel_state)
+                self._learned_travel_times[self._travel_state] = travel_time if learned is None else (learned + travel_time) / 2
+        self._travel_state = None
+        self._travel_start = None
+        self._travel_start_position = None
+        self._motion_seen_at = None
+        if self._cancel_travel_update is not None:
+            self._cancel_travel_update()
+            self._cancel_travel_update = None
+
+    @callback
+    def _async_travel_update(self, _now):
+        self.async_write_ha_state()
+
+    async def async_will_remove_from_hass(self):
+        self._stop_travel()
+        await super().async_will_remove_from_hass()
+
+    def _command_failed(self):
+        # The module never started the commanded motion.
+        self._stop_travel()
+        self._target_position = None
+
+    def _restore_status(self, data):
+        # A motion in the cached snapshot ended long ago, only the position
+        # is shown until the first read.
+        self._update_from_status({**data, "motion": None})
+
+    def _update_from_status(self, data):
+        temp_position = data.get("position")
+        if temp_position is not None and self._reversed == True:
+            temp_position = 100 - temp_position
+        self._state = None if temp_position is None else (STATE_CLOSED if data.get("position") == 0 else STATE_OPEN)
+        motion_state = self._motion_state(data.get("motion"))
+        if motion_state is not None:
+            self._state = motion_state
+        self._current_cover_position = temp_position
+        self._current_cover_tilt_position = data.get("tilt")
+        if motion_state is not None:
+            self._start_travel(motion_state)
+            self._motion_seen_at = time.monotonic()
+        else:
+            self._stop_travel(temp_position)
+            self._target_position = None
+
+class GrentonCoverGroup(GrentonGroupMixin, GrentonCover):
+    # Covers on one CLU moved together by a single execute call.
+    def __init__(self, coordinator, api_endpoint, grenton_objects, reversed, object_name, opening_time=None, closing_time=None):
+        super().__init__(coordinator, api_endpoint, grenton_objects[0], reversed, object_name, opening_time, closing_time)
+        self._grenton_objects = grenton_objects
+        self._unique_id = "grenton_group_" + "_".join(grenton_object.object_id for grenton_object in grenton_objects)
+
+    def _combine_status(self, members):
+        # Moving while any member moves, at the mean position and tilt.
+        motion = [data["motion"] for data in members if data.get("motion") is not None]
+        position = [data["position"] for data in members if data.get("position") is not None]
+        tilt = [data["tilt"] for data in members if data.get("tilt") is not None]
+        return {
+            "motion": next((value for value in motion if value), 0) if motion else None,
+            "position": round(sum(position) / len(position)) if position else None,
+            "tilt": round(sum(tilt) / len(tilt)) if tilt else None
+        }
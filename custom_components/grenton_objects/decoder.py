@@ -0,0 +1,108 @@
+"""Typed decoding of the values read from Grenton objects."""
+from homeassistant.util import color as color_util
+
+def decode_value(value):
+    return value
+
+def decode_number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def decode_int(value):
+    value = decode_number(value)
+    return None if value is None else int(value)
+
+def decode_bool(value):
+    value = decode_number(value)
+    return None if value is None else value != 0
+
+def decode_rgb(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        return tuple(color_util.rgb_hex_to_rgb_list(value.strip("#")))
+    except ValueError:
+        return None
+
+def scaled(factor):
+    def decode_scaled(value):
+        value = decode_number(value)
+        return None if value is None else value * factor
+    return decode_scaled
+
+def scaled_int(factor):
+    # For Home Assistant attributes that only take whole numbers, e.g. the
+    # 0-255 brightness.
+    decode_scaled = scaled(factor)
+    def decode_scaled_int(value):
+        value = decode_scaled(value)
+        return None if value is None else round(value)
+    return decode_scaled_int
+
+class GrentonStatusSchema:
+    # Fields are given as {attribute: (feature index, decoder)} and get the
+    # status keys in that order. A feature index of None marks a value that
+    # is not read with OBJ:get, e.g. a user feature.
+    __slots__ = ("fields", "features", "_spec")
+
+    def __init__(self, fields):
+        self._spec = dict(fields)
+        self.fields = tuple(
+            ("status" if number == 0 else f"status_{number + 1}", attribute, index, decoder)
+            for number, (attribute, (index, decoder)) in enumerate(fields.items())
+        )
+        self.features = {
+            status_key: index
+            for status_key, _, index, _ in self.fields
+            if index is not None
+        }
+
+    def split(self, attributes):
+        # Schemas of the remaining fields and of the given attributes, each
+        # numbered from "status" again.
+        return (
+            GrentonStatusSchema({attribute: field for attribute, field in self._spec.items() if attribute not in attributes}),
+            GrentonStatusSchema({attribute: field for attribute, field in self._spec.items() if attribute in attributes})
+        )
+
+    def decode(self, values, partial=False):
+        # Missing and nil values decode to None instead of raising, a
+        # partial decode only covers the status keys present in values.
+        decoded = {}
+        for status_key, attribute, _, decoder in self.fields:
+            if partial and status_key not in values:
+                continue
+            decoded[attribute] = decoder(values.get(status_key))
+        return decoded
+
+class GrentonDelimitedSchema:
+    # A single "status" value holding the values of several attributes
+    # joined by a separator, as returned by an aggregate command.
+    __slots__ = ("attributes", "separator", "decoder", "features")
+
+    def __init__(self, attributes, separator, decoder=decode_number):
+        self.attributes = tuple(attributes)
+        self.separator = separator
+        self.decoder = decoder
+        self.features = {}
+
+    def decode(self, values, partial=False):
+        # A pushed value of a single object has no place in the joined one.
+        if partial:
+            return {}
+        value = values.get("status")
+        items = value.split(self.separator) if isinstance(value, str) else []
+        return {
+            attribute: self.decoder(items[position]) if position < len(items) else None
+            for position, attribute in enumerate(self.attributes)
+        }
@@ -0,0 +1,108 @@
+"""Discovery of Grenton objects defined on the CLUs."""
+import aiohttp
+import logging
+from homeassistant.const import Platform
+from homeassistant.helpers import discovery
+from homeassistant.helpers.event import async_call_later
+from .coordinator import get_coordinator
+from .objects import get_object_ref
+from .const import (
+    DOMAIN,
+    CONF_API_ENDPOINT,
+    CONF_CLUS,
+    CONF_FAMILIES,
+    CONF_EXCLUDE,
+    DATA_HASS_CONFIG,
+    DATA_OBJECTS
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+DISCOVERY_RETRY_INTERVAL = 60
+DISCOVERY_SEPARATOR = ';'
+
+# Platform of each object family, following the defaults the platforms
+# use when no grenton_type is configured.
+DISCOVERY_PLATFORMS = {
+    "DOU": Platform.LIGHT,
+    "DIM": Platform.LIGHT,
+    "LED": Platform.LIGHT,
+    "ROL": Platform.COVER,
+    "THE": Platform.CLIMATE,
+    "TEM": Platform.SENSOR,
+    "DIN": Platform.BINARY_SENSOR,
+}
+
+SUPPORTED_PLATFORMS = (
+    Platform.LIGHT,
+    Platform.SWITCH,
+    Platform.COVER,
+    Platform.CLIMATE,
+    Platform.SENSOR,
+    Platform.BINARY_SENSOR,
+)
+
+def build_discovery_command(clu_id):
+    # Objects are globals on the CLU named by their family and number.
+    code = (
+        "local r = {} "
+        "for k in pairs(_G) do "
+        "if type(k) == \"string\" and k:match(\"^%u+%d+$\") then r[#r + 1] = k end "
+        "end "
+        f"return table.concat(r, \"{DISCOVERY_SEPARATOR}\")"
+    )
+    return f"return {clu_id}:execute(0, '{code}')"
+
+async def async_discover(hass, gateways):
+    for gateway in gateways:
+        await async_discover_gateway(hass, gateway)
+
+async def async_discover_gateway(hass, gateway):
+    api_endpoint = gateway[CONF_API_ENDPOINT]
+    clu_ids = gateway[CONF_CLUS]
+    coordinator = get_coordinator(hass, api_endpoint)
+
+    # All CLUs of a Gate are listed with a single request.
+    payload = {}
+    for clu_id in clu_ids:
+        payload["status" if not payload else f"status_{len(payload) + 1}"] = build_discovery_command(clu_id)
+    try:
+        data = await coordinator.client.get(payload)
+    except aiohttp.ClientError as ex:
+        _LOGGER.warning(f"Failed to discover Grenton objects on {api_endpoint}, retrying in {DISCOVERY_RETRY_INTERVAL} seconds: {ex}")
+
+        async def _async_retry(_now):
+            await async_discover_gateway(hass, gateway)
+
+        async_call_later(hass, DISCOVERY_RETRY_INTERVAL, _async_retry)
+        return
+
+    families = {**DISCOVERY_PLATFORMS, **gateway[CONF_FAMILIES]}
+    exclude = set(gateway[CONF_EXCLUDE])
+    # Objects already configured in YAML keep their own configuration.
+    configured = hass.data[DOMAIN].get(DATA_OBJECTS, {})
+    platforms = {}
+    for batch_key, clu_id in zip(payload, clu_ids):
+        value = data.get(batch_key)
+        if not isinstance(value, str):
+            _LOGGER.warning(f"No objects discovered on {clu_id}")
+            continue
+        for object_id in sorted(filter(None, value.split(DISCOVERY_SEPARATOR))):
+            grenton_id = f"{clu_id}->{object_id}"
+            if grenton_id in exclude or grenton_id in configured:
+                continue
+            platform = families.get(get_object_ref(hass, grenton_id).family)
+            if platform is not None:
+                platforms.setdefault(platform, []).append(grenton_id)
+
+    for platform, grenton_ids in platforms.items():
+        _LOGGER.info(f"Discovered {len(grenton_ids)} {platform} objects on {api_endpoint}")
+        hass.async_create_task(
+            discovery.async_load_platform(
+                hass,
+                platform,
+                DOMAIN,
+                {CONF_API_ENDPOINT: api_endpoint, "grenton_ids": grenton_ids},
+                hass.data[DOMAIN].get(DATA_HASS_CONFIG, {})
+            )
+        )
@@ -0,0 +1,332 @@
+"""Base entity for Grenton objects."""
+import asyncio
+import aiohttp
+import logging
+import time
+from homeassistant.core import callback, split_entity_id
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from .const import DOMAIN, DATA_STATE_CACHE
+from .coordinator import DEFAULT_PRIORITY
+from .objects import build_clu_command
+
+_LOGGER = logging.getLogger(__name__)
+
+# Time in seconds a module needs to apply a command before its state is
+# read back. Z-Wave devices report their state noticeably later.
+SETTLE_TIMES = {
+    "DOU": 0.5,
+    "DIM": 1,
+    "LED": 1,
+    "ROL": 2,
+    "THE": 1,
+    "ZWA": 3,
+}
+DEFAULT_SETTLE_TIME = 1
+
+class GrentonEntity(CoordinatorEntity):
+    _deadband = 0
+    _refresh_priority = DEFAULT_PRIORITY
+    _command_interval = 0
+    # Attributes that rarely change, they are read on the coordinator's
+    # slow interval, at startup and after a command.
+    _slow_attributes = ()
+    _cache_ttl = None
+
+    def __init__(self, coordinator):
+        super().__init__(coordinator)
+        self._optimistic_until = None
+        self._cancel_confirm = None
+        self._written_available = None
+        self._pending_write = False
+        self._last_command_at = None
+        self._limited_commands = {}
+        self._cancel_limited_command = None
+        self._stale = False
+
+    def _status_schema(self):
+        raise NotImplementedError
+
+    def _status_features(self):
+        return self._status_schema().features
+
+    def _status_command(self):
+        return self._features_command(self._status_features())
+
+    def _features_command(self, features):
+        return {
+            status_key: self._grenton_object.get(index)
+            for status_key, index in features.items()
+        }
+
+    def _update_from_status(self, data):
+        raise NotImplementedError
+
+    def _fast_poll_interval(self, data):
+        return None
+
+    def _registrations(self):
+        # (coordinator key, object, schema, status command, scan interval)
+        # of every object the entity reads.
+        if not self._slow_attributes:
+            return [(self.entity_id, self._grenton_object, self._status_schema(), self._status_command(), None)]
+        schema, slow_schema = self._status_schema().split(self._slow_attributes)
+        return [
+            (self.entity_id, self._grenton_object, schema, self._features_command(schema.features), None),
+            (
+                self._slow_key,
+                self._grenton_object,
+                slow_schema,
+                self._features_command(slow_schema.features),
+                self.coordinator.slow_scan_interval
+            )
+        ]
+
+    def _has_primary_feature(self, schema):
+        # A single pushed value belongs to the object's main feature, the
+        # first field of the unsplit schema, so of a split entity only the
+        # key holding that field takes it.
+        if not self._slow_attributes:
+            return True
+        _, attribute, _, _ = self._status_schema().fields[0]
+        return any(field[1] == attribute for field in schema.fields)
+
+    @property
+    def _slow_key(self):
+        return f"{self.entity_id}/slow"
+
+    def _status_keys(self):
+        if self._slow_attributes:
+            return [self.entity_id, self._slow_key]
+        return [self.entity_id]
+
+    def _status_data(self):
+        # Values of all keys of the entity, missing until a key is read.
+        data = self.coordinator.data or {}
+        values = [data[key] for key in self._status_keys() if key in data]
+        if not values:
+            return None
+        status = {}
+        for value in values:
+            status.update(value)
+        return status
+
+    def _command_objects(self):
+        return [self._grenton_object]
+
+    @property
+    def _command_target(self):
+        return self._grenton_object.grenton_id
+
+    def _build_command(self, expressions):
+        # Expressions of all objects are run by a single execute call, so
+        # they take effect on the CLU at the same time.
+        grenton_objects = self._command_objects()
+        return {"command": build_clu_command(
+            grenton_objects[0].clu_id,
+            [expression for grenton_object in grenton_objects for expression in expressions(grenton_object)]
+        )}
+
+    @property
+    def extra_state_attributes(self):
+        # Set while the state restored from the cache was not read yet.
+        return {"stale": True} if self._stale else None
+
+    def _restore_status(self, data):
+        # Shows a cached snapshot, which may be arbitrarily old.
+        self._update_from_status(data)
+
+    def _state_cache(self):
+        return self.hass.data.get(DOMAIN, {}).get(DATA_STATE_CACHE)
+
+    async def async_added_to_hass(self):
+        # The last known state is shown until the first read completes.
+        state_cache = self._state_cache()
+        if state_cache is not None and self._status_data() is None:
+            data = state_cache.get(self.unique_id)
+            if data is not None:
+                self._restore_status(data)
+                self._stale = True
+        for key, grenton_object, schema, command, scan_interval in self._registrations():
+            self.coordinator.register(
+                key,
+                command,
+                grenton_object,
+                schema,
+                self._fast_poll_interval,
+                self._deadband,
+                self._refresh_priority,
+                scan_interval,
+                self._cache_ttl,
+                self._has_primary_feature(schema)
+            )
+        await super().async_added_to_hass()
+        await self.coordinator.async_request_refresh()
+
+    async def async_will_remove_from_hass(self):
+        self._cancel_pending_limited_command()
+        if self._cancel_confirm is not None:
+            self._cancel_confirm()
+            self._cancel_confirm = None
+        for key in self._status_keys():
+            self.coordinator.unregister(key)
+        await super().async_will_remove_from_hass()
+
+    async def async_update(self):
+        for key in self._status_keys():
+            self.coordinator.mark_due(key)
+        await super().async_update()
+
+    async def _async_command(self, command, kind="state"):
+        # The commanded state set by the caller is shown right away and kept
+        # until a targeted read after the module's settle time confirms it.
+        # A pending command only gives way to a newer one of the same kind,
+        # i.e. one that writes the same feature.
+        self._cancel_pending_limited_command(kind)
+        settle_time = SETTLE_TIMES.get(self._grenton_object.family, DEFAULT_SETTLE_TIME)
+        self._last_command_at = time.monotonic()
+        self._optimistic_until = self._last_command_at + settle_time
+        self.async_write_ha_state()
+        try:
+            await self.coordinator.client.command(
+                command,
+                (self._command_target, kind),
+                split_entity_id(self.entity_id)[0],
+                self._grenton_object.clu_id
+            )
+        except aiohttp.ClientError:
+            # The read back replaces the commanded state even when the value
+            # on the Gate did not change.
+            self._optimistic_until = None
+            self._pending_write = True
+            self._command_failed()
+            self._async_schedule_confirm(0)
+            raise
+        self._async_schedule_confirm(settle_time)
+
+    def _command_failed(self):
+        pass
+
+    async def _async_limited_command(self, command, kind="state"):
+        # Commands repeated faster than the command interval, e.g. while a
+        # slider is dragged, are held back and only the latest one of each
+        # kind is sent when the interval has passed.
+        now = time.monotonic()
+        wait = 0
+        if self._last_command_at is not None:
+            wait = self._last_command_at + self._command_interval - now
+        if wait <= 0 and self._cancel_limited_command is None:
+            await self._async_command(command, kind)
+            return
+        settle_time = SETTLE_TIMES.get(self._grenton_object.family, DEFAULT_SETTLE_TIME)
+        self._limited_commands[kind] = command
+        self._optimistic_until = now + max(wait, 0) + settle_time
+        self.async_write_ha_state()
+        if self._cancel_limited_command is None:
+            self._cancel_limited_command = async_call_later(
+                self.hass, max(wait, 0), self._async_send_limited_command
+            )
+
+    async def _async_send_limited_command(self, _now):
+        # Held commands of all kinds go out in the same command batch.
+        self._cancel_limited_command = None
+        commands = self._limited_commands
+        self._limited_commands = {}
+        results = await asyncio.gather(
+            *(self._async_command(command, kind) for kind, command in commands.items()),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, aiohttp.ClientError):
+                _LOGGER.error(f"Failed to send the command to {self._grenton_object.grenton_id}: {result}")
+            elif isinstance(result, Exception):
+                raise result
+
+    @callback
+    def _cancel_pending_limited_command(self, kind=None):
+        # Drops the held commands of the given kind, or all of them.
+        if kind is None:
+            self._limited_commands.clear()
+        else:
+            self._limited_commands.pop(kind, None)
+        if not self._limited_commands and self._cancel_limited_command is not None:
+            self._cancel_limited_command()
+            self._cancel_limited_command = None
+
+    @callback
+    def _async_schedule_confirm(self, delay):
+        if self._cancel_confirm is not None:
+            self._cancel_confirm()
+        self._cancel_confirm = async_call_later(self.hass, delay, self._async_confirm)
+
+    async def _async_confirm(self, _now):
+        self._cancel_confirm = None
+        for key in self._status_keys():
+            self.coordinator.mark_due(key)
+        await self.coordinator.async_request_refresh()
+
+    @callback
+    def _handle_coordinator_update(self):
+        if self._optimistic_until is not None:
+            if time.monotonic() < self._optimistic_until:
+                return
+            # The read value replaces the commanded state even if it did
+            # not change on the Gate.
+            self._optimistic_until = None
+            self._pending_write = True
+        # Only real changes are written to the state machine, a poll that
+        # returns the same values leaves the entity untouched.
+        available = self.available
+        if (
+            not self._pending_write
+            and available == self._written_available
+            and not any(self.coordinator.has_changed(key) for key in self._status_keys())
+        ):
+            return
+        self._pending_write = False
+        self._written_available = available
+        data = self._status_data()
+        if data is not None:
+            self._update_from_status(data)
+            self._stale = False
+            state_cache = self._state_cache()
+            if state_cache is not None:
+                state_cache.async_set(self.unique_id, data)
+        super()._handle_coordinator_update()
+
+class GrentonGroupMixin:
+    # Reads every member object under its own coordinator key and hands the
+    # combined values of all members to _update_from_status.
+    def _registrations(self):
+        schema = self._status_schema()
+        return [
+            (
+                self._member_key(grenton_object),
+                grenton_object,
+                schema,
+                {status_key: grenton_object.get(index) for status_key, index in schema.features.items()},
+                None
+            )
+            for grenton_object in self._grenton_objects
+        ]
+
+    def _member_key(self, grenton_object):
+        return f"{self.entity_id}/{grenton_object.object_id}"
+
+    def _status_keys(self):
+        return [self._member_key(grenton_object) for grenton_object in self._grenton_objects]
+
+    def _status_data(self):
+        data = self.coordinator.data or {}
+        members = [data[key] for key in self._status_keys() if key in data]
+        return self._combine_status(members) if members else None
+
+    def _combine_status(self, members):
+        raise NotImplementedError
+
+    def _command_objects(self):
+        return self._grenton_objects
+
+    @property
+    def _command_target(self):
+        return self.entity_id
@@ -1,14 +1,25 @@
-import requests
+import aiohttp
 import logging
 import json
 import voluptuous as vol
 from homeassistant.components.light import (
     LightEntity, 
     PLATFORM_SCHEMA, 
-    ColorMode
+    ColorMode,
+    LightEntityFeature
 )
 from homeassistant.const import (STATE_ON, STATE_OFF)
-from homeassistant.util import color as color_util
+import homeassistant.helpers.config_validation as cv
+from .coordinator import get_coordinator
+from .decoder import (
+    GrentonStatusSchema,
+    decode_bool,
+    decode_number,
+    decode_rgb,
+    scaled_int
+)
+from .entity import GrentonEntity, GrentonGroupMixin
+from .objects import get_object_ref, same_clu
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -16,39 +27,80 @@ DOMAIN = 'grenton_objects'
 
 CONF_API_ENDPOINT = 'api_endpoint'
 CONF_GRENTON_ID = 'grenton_id'
+CONF_GRENTON_IDS = 'grenton_ids'
 CONF_GRENTON_TYPE = 'grenton_type'
 CONF_OBJECT_NAME = 'name'
+CONF_COMMAND_INTERVAL = 'command_interval'
+CONF_RAMP_TIME_FEATURE = 'ramp_time_feature'
+
+DEFAULT_COMMAND_INTERVAL = 0.3
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
-    vol.Required(CONF_API_ENDPOINT): str,
-    vol.Required(CONF_GRENTON_ID): str,
-    vol.Required(CONF_GRENTON_TYPE, default='UNKNOWN'): str, #DOUT, DIMMER, RGB
-    vol.Optional(CONF_OBJECT_NAME, default='Grenton Light'): str
-})
+DOUT_SCHEMA = GrentonStatusSchema({"is_on": (0, decode_bool)})
+DIMMER_SCHEMA = GrentonStatusSchema({"brightness": (0, scaled_int(255))})
+ZWAVE_DIMMER_SCHEMA = GrentonStatusSchema({"brightness": (0, decode_number)})
+RGB_SCHEMA = GrentonStatusSchema({"brightness": (0, scaled_int(255)), "rgb_color": (6, decode_rgb)})
+ZWAVE_RGB_SCHEMA = GrentonStatusSchema({"brightness": (0, scaled_int(255)), "rgb_color": (3, decode_rgb)})
+
+PLATFORM_SCHEMA = vol.All(
+    cv.has_at_least_one_key(CONF_GRENTON_ID, CONF_GRENTON_IDS),
+    PLATFORM_SCHEMA.extend({
+        vol.Required(CONF_API_ENDPOINT): str,
+        vol.Exclusive(CONF_GRENTON_ID, 'grenton_object'): str,
+        vol.Exclusive(CONF_GRENTON_IDS, 'grenton_object'): vol.All(cv.ensure_list, [str], vol.Length(min=2), same_clu),
+        vol.Required(CONF_GRENTON_TYPE, default='UNKNOWN'): str, #DOUT, DIMMER, RGB
+        vol.Optional(CONF_OBJECT_NAME, default='Grenton Light'): str,
+        vol.Optional(CONF_COMMAND_INTERVAL, default=DEFAULT_COMMAND_INTERVAL): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_RAMP_TIME_FEATURE): vol.All(vol.Coerce(int), vol.Range(min=0))
+    })
+)
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    if discovery_info is not None:
+        api_endpoint = discovery_info[CONF_API_ENDPOINT]
+        coordinator = get_coordinator(hass, api_endpoint)
+        async_add_entities([
+            GrentonLight(coordinator, api_endpoint, get_object_ref(hass, grenton_id), "UNKNOWN", grenton_id)
+            for grenton_id in discovery_info["grenton_ids"]
+        ])
+        return
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
     api_endpoint = config.get(CONF_API_ENDPOINT)
     grenton_id = config.get(CONF_GRENTON_ID)
+    grenton_ids = config.get(CONF_GRENTON_IDS)
     grenton_type = config.get(CONF_GRENTON_TYPE)
     object_name = config.get(CONF_OBJECT_NAME)
+    command_interval = config.get(CONF_COMMAND_INTERVAL)
+    ramp_time_feature = config.get(CONF_RAMP_TIME_FEATURE)
+
+    coordinator = get_coordinator(hass, api_endpoint)
+
+    if grenton_ids:
+        grenton_objects = [get_object_ref(hass, grenton_id) for grenton_id in grenton_ids]
+        async_add_entities([GrentonLightGroup(coordinator, api_endpoint, grenton_objects, grenton_type, object_name, command_interval, ramp_time_feature)])
+        return
 
-    add_entities([GrentonLight(api_endpoint, grenton_id, grenton_type, object_name)], True)
+    grenton_object = get_object_ref(hass, grenton_id)
 
-class GrentonLight(LightEntity):
-    def __init__(self, api_endpoint, grenton_id, grenton_type, object_name):
+    async_add_entities([GrentonLight(coordinator, api_endpoint, grenton_object, grenton_type, object_name, command_interval, ramp_time_feature)])
+
+class GrentonLight(GrentonEntity, LightEntity):
+    def __init__(self, coordinator, api_endpoint, grenton_object, grenton_type, object_name, command_interval=DEFAULT_COMMAND_INTERVAL, ramp_time_feature=None):
+        super().__init__(coordinator)
         self._api_endpoint = api_endpoint
-        self._grenton_id = grenton_id
+        self._grenton_object = grenton_object
         self._grenton_type = grenton_type
         self._object_name = object_name
         self._state = None
-        self._unique_id = f"grenton_{grenton_id.split('->')[1]}"
+        self._unique_id = f"grenton_{grenton_object.object_id}"
         self._supported_color_modes: set[ColorMode | str] = set()
         self._brightness = None
         self._rgb_color = None
+        self._command_interval = command_interval
+        self._ramp_time_feature = ramp_time_feature
 
-        if grenton_id.split('->')[1].startswith("DIM"):
+        if grenton_object.family == "DIM":
             if grenton_type == "UNKNOWN": self._grenton_type = "DIMMER"
-        elif grenton_id.split('->')[1].startswith("LED"):
+        elif grenton_object.family == "LED":
             if grenton_type == "UNKNOWN": self._grenton_type = "RGB"
         else:
             if grenton_type == "UNKNOWN": self._grenton_type = "DOUT"
@@ -81,6 +133,14 @@ class GrentonLight(LightEntity):
         else:
             return ColorMode.ONOFF
 
+    @property
+    def supported_features(self):
+        # The ramp time is a module setting, transitions are only offered
+        # when it is configured.
+        if self._ramp_time_feature is None:
+            return LightEntityFeature(0)
+        return LightEntityFeature.TRANSITION
+
     @property
     def unique_id(self):
         return self._unique_id
@@ -93,77 +153,104 @@ class GrentonLight(LightEntity):
     def rgb_color(self):
         return self._rgb_color
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(0, 1)')"}
             if self._grenton_type == "DIMMER":
-                brightness = kwargs.get("brightness", 255)
-                if self._grenton_id.split('->')[1].startswith("ZWA"):
-                    command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(0, {brightness})')"}
-                else:
-                    scaled_brightness = brightness / 255
-                    command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(0, {scaled_brightness})')"}
-                self._brightness = brightness
+                self._brightness = kwargs.get("brightness", 255)
             elif self._grenton_type == "RGB":
-                rgb_color = kwargs.get("rgb_color")
-                if rgb_color:
-                    hex_color = '#{:02x}{:02x}{:02x}'.format(*rgb_color)
-                    if self._grenton_id.split('->')[1].startswith("ZWA"):
-                        command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(3, \"{hex_color}\")')"}
-                    else:
-                        command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(6, \"{hex_color}\")')"}
-                    self._rgb_color = rgb_color
+                if kwargs.get("rgb_color"):
+                    self._rgb_color = kwargs["rgb_color"]
                 else:
-                    brightness = kwargs.get("brightness", 255)
-                    scaled_brightness = brightness / 255
-                    command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(0, {scaled_brightness})')"}
-                    self._brightness = brightness
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json=command
-            ) 
-            response.raise_for_status()
+                    self._brightness = kwargs.get("brightness", 255)
             self._state = STATE_ON
-            self._brightness = None
-        except requests.RequestException as ex:
+            command = self._build_command(lambda grenton_object: self._turn_on_expressions(grenton_object, **kwargs))
+            kind = "color" if kwargs.get("rgb_color") else "state"
+            if "brightness" in kwargs or "rgb_color" in kwargs:
+                await self._async_limited_command(command, kind)
+            else:
+                await self._async_command(command, kind)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to turn on the light: {ex}")
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(0, 0)')"}
-            if self._grenton_type == "RGB" or (self._grenton_type == "DIMMER" and self._grenton_id.split('->')[1].startswith("ZWA")):
-                command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:execute(0, 0)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
             self._state = STATE_OFF
-        except requests.RequestException as ex:
+            command = self._build_command(lambda grenton_object: self._turn_off_expressions(grenton_object, **kwargs))
+            await self._async_command(command)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to turn off the light: {ex}")
 
-    def update(self):
-        try:
-            command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(0)')"}
-            if self._grenton_type == "RGB":
-                if self._grenton_id.split('->')[1].startswith("ZWA"):
-                    command.update({"status_2": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(3)')"})
-                else:
-                    command.update({"status_2": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(6)')"})
-            response = requests.get(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-            data = response.json()
-            self._state = STATE_OFF if data.get("status") == 0 else STATE_ON
-            if self._grenton_type == "RGB" or self._grenton_type == "DIMMER":
-                if self._grenton_type == "DIMMER" and self._grenton_id.split('->')[1].startswith("ZWA"):
-                    self._brightness = data.get("status")
-                else:
-                    self._brightness = data.get("status") * 255
-            if self._grenton_type == "RGB":
-                self._rgb_color = color_util.rgb_hex_to_rgb_list(data.get("status_2").strip("#"))
-        except requests.RequestException as ex:
-            _LOGGER.error(f"Failed to update the light state: {ex}")
-            self._state = None
+    def _transition_expressions(self, grenton_object, transition):
+        # Set in the same execute call as the value. The ramp time stays on
+        # the module, so it is reset to 0 for changes without a transition.
+        if self._ramp_time_feature is None:
+            return []
+        return [grenton_object.set_expression(self._ramp_time_feature, int((transition or 0) * 1000))]
+
+    def _turn_on_expressions(self, grenton_object, **kwargs):
+        expressions = self._transition_expressions(grenton_object, kwargs.get("transition"))
+        if self._grenton_type == "DIMMER":
+            brightness = kwargs.get("brightness", 255)
+            if grenton_object.is_zwave:
+                expressions.append(grenton_object.execute_expression(0, brightness))
+            else:
+                expressions.append(grenton_object.set_expression(0, brightness / 255))
+        elif self._grenton_type == "RGB":
+            rgb_color = kwargs.get("rgb_color")
+            if rgb_color:
+                hex_color = '#{:02x}{:02x}{:02x}'.format(*rgb_color)
+                index = 3 if grenton_object.is_zwave else 6
+                expressions.append(grenton_object.execute_expression(index, f'"{hex_color}"'))
+            else:
+                expressions.append(grenton_object.execute_expression(0, kwargs.get("brightness", 255) / 255))
+        else:
+            expressions.append(grenton_object.set_expression(0, 1))
+        return expressions
+
+    def _turn_off_expressions(self, grenton_object, **kwargs):
+        expressions = self._transition_expressions(grenton_object, kwargs.get("transition"))
+        if self._grenton_type == "RGB" or (self._grenton_type == "DIMMER" and grenton_object.is_zwave):
+            expressions.append(grenton_object.execute_expression(0, 0))
+        else:
+            expressions.append(grenton_object.set_expression(0, 0))
+        return expressions
+
+    def _status_schema(self):
+        if self._grenton_type == "RGB":
+            return ZWAVE_RGB_SCHEMA if self._grenton_object.is_zwave else RGB_SCHEMA
+        if self._grenton_type == "DIMMER":
+            return ZWAVE_DIMMER_SCHEMA if self._grenton_object.is_zwave else DIMMER_SCHEMA
+        return DOUT_SCHEMA
+
+    def _update_from_status(self, data):
+        if "brightness" in data:
+            self._brightness = data["brightness"]
+            is_on = None if self._brightness is None else self._brightness != 0
+        else:
+            is_on = data.get("is_on")
+        self._state = None if is_on is None else (STATE_ON if is_on else STATE_OFF)
+        if "rgb_color" in data:
+            self._rgb_color = data["rgb_color"]
+
+class GrentonLightGroup(GrentonGroupMixin, GrentonLight):
+    # Lights on one CLU switched together by a single execute call. The
+    # objects are expected to be of the same type as the first one.
+    def __init__(self, coordinator, api_endpoint, grenton_objects, grenton_type, object_name, command_interval=DEFAULT_COMMAND_INTERVAL, ramp_time_feature=None):
+        super().__init__(coordinator, api_endpoint, grenton_objects[0], grenton_type, object_name, command_interval, ramp_time_feature)
+        self._grenton_objects = grenton_objects
+        self._unique_id = "grenton_group_" + "_".join(grenton_object.object_id for grenton_object in grenton_objects)
+
+    def _combine_status(self, members):
+        # On when any member is on, with the mean brightness of the members
+        # that are on.
+        combined = {}
+        if "brightness" in members[0]:
+            brightness = [data["brightness"] for data in members if data.get("brightness") is not None]
+            lit = [value for value in brightness if value]
+            combined["brightness"] = (round(sum(lit) / len(lit)) if lit else 0) if brightness else None
+        else:
+            is_on = [data["is_on"] for data in members if data.get("is_on") is not None]
+            combined["is_on"] = any(is_on) if is_on else None
+        if "rgb_color" in members[0]:
+            combined["rgb_color"] = next((data["rgb_color"] for data in members if data.get("rgb_color") is not None), None)
+        return combined
@@ -0,0 +1,105 @@
+"""Request metrics collected per gateway."""
+import bisect
+
+# Upper bounds in seconds of the latency histogram buckets, anything
+# slower ends up in the last, open-ended bucket.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class GrentonHistogram:
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, quantile):
+        # Estimated as the upper bound of the bucket holding the quantile,
+        # which is all the precision a bucketed histogram can give.
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def as_dict(self):
+        buckets = {str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "buckets": buckets
+        }
+
+class GrentonRequestStats:
+    __slots__ = ("requests", "errors", "timeouts", "bytes_sent", "bytes_received", "latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = GrentonHistogram()
+
+    def record(self, latency, bytes_sent, bytes_received, error, timeout):
+        self.requests += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        if timeout:
+            self.timeouts += 1
+        elif error:
+            self.errors += 1
+        self.latency.observe(latency)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency": self.latency.as_dict()
+        }
+
+class GrentonMetrics:
+    def __init__(self):
+        self.total = GrentonRequestStats()
+        self.methods = {}
+        self.platforms = {}
+        self.queue_delay = GrentonHistogram()
+
+    def record_request(self, method, platforms, latency, bytes_sent, bytes_received, error=False, timeout=False):
+        # A batched read covers several platforms, each of them counts the
+        # request, so per-platform numbers do not add up to the total.
+        self.total.record(latency, bytes_sent, bytes_received, error, timeout)
+        if method not in self.methods:
+            self.methods[method] = GrentonRequestStats()
+        self.methods[method].record(latency, bytes_sent, bytes_received, error, timeout)
+        for platform in platforms or ():
+            if platform not in self.platforms:
+                self.platforms[platform] = GrentonRequestStats()
+            self.platforms[platform].record(latency, bytes_sent, bytes_received, error, timeout)
+
+    def record_queue_delay(self, delay):
+        self.queue_delay.observe(delay)
+
+    def as_dict(self):
+        return {
+            "total": self.total.as_dict(),
+            "methods": {method: stats.as_dict() for method, stats in self.methods.items()},
+            "platforms": {platform: stats.as_dict() for platform, stats in self.platforms.items()},
+            "queue_delay": self.queue_delay.as_dict()
+        }
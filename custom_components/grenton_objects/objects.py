@@ -0,0 +1,103 @@
+"""Parsed Grenton object references with precompiled command templates."""
+import re
+import voluptuous as vol
+from .const import (
+    DOMAIN,
+    DATA_OBJECTS
+)
+
+FAMILY_PATTERN = re.compile(r"^[A-Z]+")
+
+def build_clu_command(clu_id, expressions):
+    return f"{clu_id}:execute(0, '{' '.join(expressions)}')"
+
+def same_clu(grenton_ids):
+    clu_ids = {grenton_id.split('->', 1)[0] if '->' in grenton_id else None for grenton_id in grenton_ids}
+    if len(clu_ids) != 1 or None in clu_ids:
+        raise vol.Invalid("all grenton_ids of a group must be objects on the same CLU")
+    return grenton_ids
+
+def get_object_ref(hass, grenton_id):
+    objects = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_OBJECTS, {})
+    if grenton_id not in objects:
+        objects[grenton_id] = GrentonObjectRef(grenton_id)
+    return objects[grenton_id]
+
+class GrentonObjectRef:
+    __slots__ = (
+        "grenton_id",
+        "clu_id",
+        "object_id",
+        "family",
+        "is_user_feature",
+        "templates",
+        "_gets",
+        "_remote_gets",
+        "_get_expressions"
+    )
+
+    def __init__(self, grenton_id):
+        self.grenton_id = grenton_id
+        if '->' in grenton_id:
+            self.clu_id, self.object_id = grenton_id.split('->', 1)
+        else:
+            self.clu_id, self.object_id = None, grenton_id
+        self.is_user_feature = self.clu_id is None or not self.object_id.isupper()
+        match = FAMILY_PATTERN.match(self.object_id)
+        self.family = match.group(0) if match and not self.is_user_feature else None
+
+        if self.clu_id is None:
+            get_var = f"return getVar(\"{self.object_id}\")"
+        else:
+            get_var = f"return {self.clu_id}:execute(0, 'getVar(\"{self.object_id}\")')"
+        self.templates = {
+            "get": f"return {self.clu_id}:execute(0, '{self.object_id}:get({{}})')",
+            "remote_get": f"{self.clu_id}:execute(0, '{self.object_id}:get({{}})')",
+            "get_expression": f"{self.object_id}:get({{}})",
+            "set": f"{self.clu_id}:execute(0, '{self.object_id}:set({{}}, {{}})')",
+            "execute": f"{self.clu_id}:execute(0, '{self.object_id}:execute({{}}, {{}})')",
+            "set_expression": f"{self.object_id}:set({{}}, {{}})",
+            "execute_expression": f"{self.object_id}:execute({{}}, {{}})",
+            "get_var": get_var,
+            "get_var_expression": f"getVar(\"{self.object_id}\")"
+        }
+        self._gets = {}
+        self._remote_gets = {}
+        self._get_expressions = {}
+
+    @property
+    def is_zwave(self):
+        return self.family == "ZWA"
+
+    def get(self, index):
+        if index not in self._gets:
+            self._gets[index] = self.templates["get"].format(index)
+        return self._gets[index]
+
+    def remote_get(self, index):
+        if index not in self._remote_gets:
+            self._remote_gets[index] = self.templates["remote_get"].format(index)
+        return self._remote_gets[index]
+
+    def get_expression(self, index):
+        if index not in self._get_expressions:
+            self._get_expressions[index] = self.templates["get_expression"].format(index)
+        return self._get_expressions[index]
+
+    def get_var(self):
+        return self.templates["get_var"]
+
+    def get_var_expression(self):
+        return self.templates["get_var_expression"]
+
+    def set(self, index, value):
+        return self.templates["set"].format(index, value)
+
+    def execute(self, index, value):
+        return self.templates["execute"].format(index, value)
+
+    def set_expression(self, index, value):
+        return self.templates["set_expression"].format(index, value)
+
+    def execute_expression(self, index, value):
+        return self.templates["execute_expression"].format(index, value)
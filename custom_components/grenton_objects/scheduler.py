@@ -0,0 +1,62 @@
+"""Adaptive per-entity poll scheduling."""
+
+STRETCH_FACTOR = 1.5
+
+class GrentonPollScheduler:
+    def __init__(self, scan_interval, max_scan_interval):
+        self._scan_interval = scan_interval.total_seconds()
+        self._max_scan_interval = max(max_scan_interval.total_seconds(), self._scan_interval)
+        self._base_intervals = {}
+        self._intervals = {}
+        self._ttls = {}
+        self._read_at = {}
+        self._due = {}
+
+    def add(self, key, interval=None, ttl=None):
+        # A key may be polled on a longer base interval than the scan
+        # interval, e.g. for features that rarely change. With a ttl a
+        # value is not read again within ttl seconds, neither by a regular
+        # poll nor when marked due.
+        base_interval = self._scan_interval if interval is None else max(interval.total_seconds(), self._scan_interval)
+        self._base_intervals[key] = base_interval
+        self._intervals[key] = base_interval
+        if ttl is not None:
+            self._ttls[key] = ttl.total_seconds()
+        self._due[key] = 0
+
+    def remove(self, key):
+        self._base_intervals.pop(key, None)
+        self._intervals.pop(key, None)
+        self._ttls.pop(key, None)
+        self._read_at.pop(key, None)
+        self._due.pop(key, None)
+
+    def mark_due(self, key):
+        if key in self._due:
+            self._due[key] = self._read_at.get(key, 0) + self._ttls[key] if key in self._ttls else 0
+
+    def postpone(self, key, now):
+        if key in self._due:
+            self._due[key] = now + self._base_intervals[key]
+
+    def due_keys(self, now):
+        return [key for key, due in self._due.items() if due <= now]
+
+    def next_due(self):
+        return min(self._due.values(), default=None)
+
+    def report(self, key, changed, now, override=None):
+        # Objects that keep reporting the same value are polled less and
+        # less often, any change brings them back to the base interval.
+        if key not in self._intervals:
+            return
+        self._read_at[key] = now
+        base_interval = self._base_intervals[key]
+        if changed:
+            interval = base_interval
+        else:
+            interval = min(self._intervals[key] * STRETCH_FACTOR, max(self._max_scan_interval, base_interval))
+        self._intervals[key] = interval
+        if override is not None:
+            interval = min(interval, override)
+        self._due[key] = now + max(interval, self._ttls.get(key, 0))
@@ -1,11 +1,30 @@
-import requests
 import logging
 import json
 import voluptuous as vol
+from urllib.parse import urlparse
 from homeassistant.components.sensor import (
+    SensorDeviceClass,
     SensorEntity,
+    SensorStateClass,
     PLATFORM_SCHEMA
 )
+from homeassistant.const import (
+    EntityCategory,
+    UnitOfInformation,
+    UnitOfTime
+)
+from homeassistant.exceptions import TemplateError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import slugify
+from .coordinator import (
+    get_coordinator,
+    build_aggregate_command,
+    AGGREGATE_SEPARATOR,
+    PRIORITY_LOW
+)
+from .decoder import GrentonStatusSchema, GrentonDelimitedSchema, decode_value
+from .entity import GrentonEntity
+from .objects import get_object_ref, same_clu
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -16,36 +35,151 @@ CONF_GRENTON_ID = 'grenton_id'
 CONF_GRENTON_TYPE = 'grenton_type'
 CONF_OBJECT_NAME = 'name'
 CONF_UNIT_OF_MEASUREMENT = 'unit_of_measurement'
+CONF_DEADBAND = 'deadband'
+CONF_VALUES = 'values'
+CONF_DERIVED = 'derived'
+CONF_KEY = 'key'
+CONF_VALUE_TEMPLATE = 'value_template'
+CONF_CACHE_TTL = 'cache_ttl'
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
-    vol.Required(CONF_API_ENDPOINT): str,
+def values_on_same_clu(values):
+    same_clu([value[CONF_GRENTON_ID] for value in values])
+    return values
+
+VALUE_SCHEMA = vol.Schema({
     vol.Required(CONF_GRENTON_ID): str,
-    vol.Required(CONF_GRENTON_TYPE, default='UNKNOWN'): str, #MODBUS_RTU, MODBUS_VALUE, MODBUS, MODBUS_CLIENT, MODBUS_SLAVE_RTU
-    vol.Required(CONF_UNIT_OF_MEASUREMENT, default='°C'): str,
-    vol.Optional(CONF_OBJECT_NAME, default='Grenton Sensor'): str
+    vol.Optional(CONF_KEY): cv.slug,
+    vol.Optional(CONF_OBJECT_NAME): str,
+    vol.Optional(CONF_UNIT_OF_MEASUREMENT): str
 })
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
+DERIVED_SCHEMA = vol.Schema({
+    vol.Required(CONF_OBJECT_NAME): str,
+    vol.Required(CONF_VALUE_TEMPLATE): cv.template,
+    vol.Optional(CONF_UNIT_OF_MEASUREMENT): str
+})
+
+PLATFORM_SCHEMA = vol.All(
+    cv.has_at_least_one_key(CONF_GRENTON_ID, CONF_VALUES),
+    PLATFORM_SCHEMA.extend({
+        vol.Required(CONF_API_ENDPOINT): str,
+        vol.Exclusive(CONF_GRENTON_ID, 'grenton_object'): str,
+        vol.Exclusive(CONF_VALUES, 'grenton_object'): vol.All(cv.ensure_list, [VALUE_SCHEMA], vol.Length(min=1), values_on_same_clu),
+        vol.Required(CONF_GRENTON_TYPE, default='UNKNOWN'): str, #MODBUS_RTU, MODBUS_VALUE, MODBUS, MODBUS_CLIENT, MODBUS_SLAVE_RTU
+        vol.Required(CONF_UNIT_OF_MEASUREMENT, default='°C'): str,
+        vol.Optional(CONF_OBJECT_NAME, default='Grenton Sensor'): str,
+        vol.Optional(CONF_DEADBAND, default=0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_DERIVED, default=[]): vol.All(cv.ensure_list, [DERIVED_SCHEMA]),
+        vol.Optional(CONF_CACHE_TTL): cv.time_period
+    })
+)
+
+# Feature index of the value for each grenton_type.
+GRENTON_TYPE_FEATURES = {
+    "MODBUS": 14,
+    "MODBUS_VALUE": 20,
+    "MODBUS_RTU": 22,
+    "MODBUS_CLIENT": 19,
+    "MODBUS_SERVER": 10,
+    "MODBUS_SLAVE_RTU": 10,
+}
+STATUS_SCHEMAS = {
+    index: GrentonStatusSchema({"value": (index, decode_value)})
+    for index in {0, None, *GRENTON_TYPE_FEATURES.values()}
+}
+
+# (key, name, unit, device class, state class, value)
+METRIC_SENSORS = (
+    ("requests", "requests", None, None, SensorStateClass.TOTAL_INCREASING,
+        lambda metrics: metrics.total.requests),
+    ("errors", "errors", None, None, SensorStateClass.TOTAL_INCREASING,
+        lambda metrics: metrics.total.errors),
+    ("timeouts", "timeouts", None, None, SensorStateClass.TOTAL_INCREASING,
+        lambda metrics: metrics.total.timeouts),
+    ("bytes_sent", "bytes sent", UnitOfInformation.BYTES, SensorDeviceClass.DATA_SIZE, SensorStateClass.TOTAL_INCREASING,
+        lambda metrics: metrics.total.bytes_sent),
+    ("bytes_received", "bytes received", UnitOfInformation.BYTES, SensorDeviceClass.DATA_SIZE, SensorStateClass.TOTAL_INCREASING,
+        lambda metrics: metrics.total.bytes_received),
+    ("latency_p50", "latency p50", UnitOfTime.MILLISECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+        lambda metrics: metrics.total.latency.quantile(0.5)),
+    ("latency_p95", "latency p95", UnitOfTime.MILLISECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+        lambda metrics: metrics.total.latency.quantile(0.95)),
+    ("queue_delay_p95", "command queue delay p95", UnitOfTime.MILLISECONDS, SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT,
+        lambda metrics: metrics.queue_delay.quantile(0.95)),
+)
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    if discovery_info is not None:
+        api_endpoint = discovery_info[CONF_API_ENDPOINT]
+        coordinator = get_coordinator(hass, api_endpoint)
+        if "grenton_ids" in discovery_info:
+            async_add_entities([
+                GrentonSensor(coordinator, api_endpoint, get_object_ref(hass, grenton_id), "UNKNOWN", grenton_id, "°C")
+                for grenton_id in discovery_info["grenton_ids"]
+            ])
+        else:
+            async_add_entities([
+                GrentonMetricSensor(coordinator, api_endpoint, *description)
+                for description in METRIC_SENSORS
+            ], True)
+        return
+
     api_endpoint = config.get(CONF_API_ENDPOINT)
     grenton_id = config.get(CONF_GRENTON_ID)
     grenton_type = config.get(CONF_GRENTON_TYPE)
     object_name = config.get(CONF_OBJECT_NAME)
     unit_of_measurement = config.get(CONF_UNIT_OF_MEASUREMENT)
+    deadband = config.get(CONF_DEADBAND)
 
-    add_entities([GrentonSensor(api_endpoint, grenton_id, grenton_type, object_name, unit_of_measurement)], True)
+    coordinator = get_coordinator(hass, api_endpoint)
 
-class GrentonSensor(SensorEntity):
-    def __init__(self, api_endpoint, grenton_id, grenton_type, object_name, unit_of_measurement):
+    if config.get(CONF_VALUES):
+        grenton_objects = [get_object_ref(hass, value[CONF_GRENTON_ID]) for value in config[CONF_VALUES]]
+        keys = [value.get(CONF_KEY, grenton_object.object_id.lower()) for value, grenton_object in zip(config[CONF_VALUES], grenton_objects)]
+        meter = GrentonModbusMeter(grenton_objects, keys, grenton_type, deadband, config.get(CONF_CACHE_TTL))
+        entities = [
+            GrentonModbusSensor(
+                coordinator,
+                meter,
+                key,
+                value.get(CONF_OBJECT_NAME, f"{object_name} {key}"),
+                value.get(CONF_UNIT_OF_MEASUREMENT),
+                f"grenton_{grenton_object.object_id}"
+            )
+            for value, grenton_object, key in zip(config[CONF_VALUES], grenton_objects, keys)
+        ]
+        for derived in config[CONF_DERIVED]:
+            value_template = derived[CONF_VALUE_TEMPLATE]
+            value_template.hass = hass
+            entities.append(GrentonModbusSensor(
+                coordinator,
+                meter,
+                None,
+                derived[CONF_OBJECT_NAME],
+                derived.get(CONF_UNIT_OF_MEASUREMENT),
+                f"grenton_{grenton_objects[0].object_id}_{slugify(derived[CONF_OBJECT_NAME])}",
+                value_template
+            ))
+        async_add_entities(entities)
+        return
+
+    grenton_object = get_object_ref(hass, grenton_id)
+
+    async_add_entities([GrentonSensor(coordinator, api_endpoint, grenton_object, grenton_type, object_name, unit_of_measurement, deadband)])
+
+class GrentonSensor(GrentonEntity, SensorEntity):
+    _refresh_priority = PRIORITY_LOW
+
+    def __init__(self, coordinator, api_endpoint, grenton_object, grenton_type, object_name, unit_of_measurement, deadband=0):
+        super().__init__(coordinator)
         self._api_endpoint = api_endpoint
-        self._grenton_id = grenton_id
+        self._grenton_object = grenton_object
         self._grenton_type = grenton_type
         self._object_name = object_name
-        if len(self._grenton_id.split('->')) == 1:
-            self._unique_id = f"grenton_{grenton_id}"
-        else:
-            self._unique_id = f"grenton_{grenton_id.split('->')[1]}"
+        self._unique_id = f"grenton_{grenton_object.object_id}"
         self._native_value = None
         self._native_unit_of_measurement = unit_of_measurement
+        self._deadband = deadband
 
     @property
     def name(self):
@@ -63,30 +197,115 @@ class GrentonSensor(SensorEntity):
     def native_unit_of_measurement(self):
         return self._native_unit_of_measurement
 
-    def update(self):
-        try:
-            if len(self._grenton_id.split('->')) == 1:
-                command = {"status": f"return getVar(\"{self._grenton_id}\")"}
-            elif self._grenton_id.split('->')[1].isupper():
-                grenton_type_mapping = {
-                    "MODBUS": 14,
-                    "MODBUS_VALUE": 20,
-                    "MODBUS_RTU": 22,
-                    "MODBUS_CLIENT": 19,
-                    "MODBUS_SERVER": 10,
-                    "MODBUS_SLAVE_RTU": 10,
-                }
-                index = grenton_type_mapping.get(self._grenton_type, 0)
-                command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get({index})')"}
-            else:
-                command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, 'getVar(\"{self._grenton_id.split('->')[1]}\")')"}
-            response = requests.get(
-                f"{self._api_endpoint}",
-                json = command
+    def _status_schema(self):
+        if self._grenton_object.is_user_feature:
+            return STATUS_SCHEMAS[None]
+        return STATUS_SCHEMAS[GRENTON_TYPE_FEATURES.get(self._grenton_type, 0)]
+
+    def _status_command(self):
+        if self._grenton_object.is_user_feature:
+            return {"status": self._grenton_object.get_var()}
+        return super()._status_command()
+
+    def _update_from_status(self, data):
+        self._native_value = data.get("value")
+
+class GrentonModbusMeter:
+    # Values of one Modbus meter on a CLU. They are read by a single execute
+    # call under one coordinator key shared by all sensors of the meter.
+    def __init__(self, grenton_objects, keys, grenton_type, deadband=0, cache_ttl=None):
+        index = GRENTON_TYPE_FEATURES.get(grenton_type, 0)
+        self.key = f"sensor.grenton_meter_{grenton_objects[0].object_id.lower()}"
+        self.grenton_object = grenton_objects[0]
+        self.deadband = deadband
+        self.cache_ttl = cache_ttl
+        self.schema = GrentonDelimitedSchema(keys, AGGREGATE_SEPARATOR)
+        self.command = {
+            "status": build_aggregate_command(
+                self.grenton_object.clu_id,
+                [grenton_object.get_expression(index) for grenton_object in grenton_objects]
             )
-            response.raise_for_status()
-            data = response.json()
-            self._native_value = data.get("status")
-        except requests.RequestException as ex:
-            _LOGGER.error(f"Failed to update the switch state: {ex}")
-            self._state = None
+        }
+
+class GrentonModbusSensor(GrentonEntity, SensorEntity):
+    _refresh_priority = PRIORITY_LOW
+
+    def __init__(self, coordinator, meter, key, object_name, unit_of_measurement, unique_id, value_template=None):
+        super().__init__(coordinator)
+        self._meter = meter
+        self._grenton_object = meter.grenton_object
+        self._key = key
+        self._object_name = object_name
+        self._unique_id = unique_id
+        self._native_value = None
+        self._native_unit_of_measurement = unit_of_measurement
+        self._value_template = value_template
+        self._deadband = meter.deadband
+        self._cache_ttl = meter.cache_ttl
+
+    @property
+    def name(self):
+        return self._object_name
+
+    @property
+    def unique_id(self):
+        return self._unique_id
+
+    @property
+    def native_value(self):
+        return self._native_value
+
+    @property
+    def native_unit_of_measurement(self):
+        return self._native_unit_of_measurement
+
+    def _registrations(self):
+        return [(self._meter.key, self._meter.grenton_object, self._meter.schema, self._meter.command, None)]
+
+    def _status_keys(self):
+        return [self._meter.key]
+
+    def _update_from_status(self, data):
+        if self._value_template is None:
+            self._native_value = data.get(self._key)
+            return
+        # Derived values are computed from the values already read.
+        if any(value is None for value in data.values()):
+            self._native_value = None
+            return
+        try:
+            self._native_value = self._value_template.async_render(data)
+        except TemplateError as ex:
+            _LOGGER.warning(f"Failed to compute {self._object_name}: {ex}")
+            self._native_value = None
+
+class GrentonMetricSensor(SensorEntity):
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, coordinator, api_endpoint, key, name, unit, device_class, state_class, value):
+        self._coordinator = coordinator
+        self._key = key
+        self._value = value
+        host = urlparse(api_endpoint).netloc or api_endpoint
+        self._attr_name = f"Grenton {host} {name}"
+        self._attr_unique_id = f"grenton_metrics_{slugify(api_endpoint)}_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
+        if unit == UnitOfTime.MILLISECONDS:
+            self._attr_suggested_display_precision = 0
+
+    async def async_update(self):
+        # Metrics live in memory, reading them costs no request.
+        metrics = self._coordinator.client.metrics
+        value = self._value(metrics)
+        if value is not None and self._attr_native_unit_of_measurement == UnitOfTime.MILLISECONDS:
+            value = value * 1000
+        self._attr_native_value = value
+        if self._key == "requests":
+            self._attr_extra_state_attributes = {
+                f"{name.lower()}_requests": stats.requests
+                for name, stats in {**metrics.methods, **metrics.platforms}.items()
+            }
+        elif self._key == "latency_p95":
+            self._attr_extra_state_attributes = {"buckets": metrics.total.latency.as_dict()["buckets"]}
@@ -0,0 +1,33 @@
+"""Last known state of the entities, kept across restarts."""
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.state"
+
+# Seconds to collect updates before the snapshot is written, the pending
+# snapshot is always written when Home Assistant stops.
+SAVE_DELAY = 60
+
+class GrentonStateCache:
+    # Decoded status values of every entity keyed by its unique_id.
+    def __init__(self, hass):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._states = {}
+
+    async def async_load(self):
+        self._states = await self._store.async_load() or {}
+
+    def get(self, unique_id):
+        return self._states.get(unique_id)
+
+    @callback
+    def async_set(self, unique_id, data):
+        # Tuples are stored as lists, compared the same way they are read
+        # back so an unchanged state does not schedule a write.
+        data = {key: list(value) if isinstance(value, tuple) else value for key, value in data.items()}
+        if self._states.get(unique_id) == data:
+            return
+        self._states[unique_id] = data
+        self._store.async_delay_save(lambda: self._states, SAVE_DELAY)
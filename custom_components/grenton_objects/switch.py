@@ -1,4 +1,4 @@
-import requests
+import aiohttp
 import logging
 import json
 import voluptuous as vol
@@ -7,6 +7,10 @@ from homeassistant.components.switch import (
     PLATFORM_SCHEMA
 )
 from homeassistant.const import (STATE_ON, STATE_OFF)
+from .coordinator import get_coordinator
+from .decoder import GrentonStatusSchema, decode_bool
+from .entity import GrentonEntity
+from .objects import get_object_ref
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -16,26 +20,41 @@ CONF_API_ENDPOINT = 'api_endpoint'
 CONF_GRENTON_ID = 'grenton_id'
 CONF_OBJECT_NAME = 'name'
 
+STATUS_SCHEMA = GrentonStatusSchema({"is_on": (0, decode_bool)})
+
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_API_ENDPOINT): str,
     vol.Required(CONF_GRENTON_ID): str,
     vol.Optional(CONF_OBJECT_NAME, default='Grenton Switch'): str
 })
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    if discovery_info is not None:
+        api_endpoint = discovery_info[CONF_API_ENDPOINT]
+        coordinator = get_coordinator(hass, api_endpoint)
+        async_add_entities([
+            GrentonSwitch(coordinator, api_endpoint, get_object_ref(hass, grenton_id), grenton_id)
+            for grenton_id in discovery_info["grenton_ids"]
+        ])
+        return
+
     api_endpoint = config.get(CONF_API_ENDPOINT)
     grenton_id = config.get(CONF_GRENTON_ID)
     object_name = config.get(CONF_OBJECT_NAME)
 
-    add_entities([GrentonSwitch(api_endpoint, grenton_id, object_name)], True)
+    coordinator = get_coordinator(hass, api_endpoint)
+    grenton_object = get_object_ref(hass, grenton_id)
+
+    async_add_entities([GrentonSwitch(coordinator, api_endpoint, grenton_object, object_name)])
 
-class GrentonSwitch(SwitchEntity):
-    def __init__(self, api_endpoint, grenton_id, object_name):
+class GrentonSwitch(GrentonEntity, SwitchEntity):
+    def __init__(self, coordinator, api_endpoint, grenton_object, object_name):
+        super().__init__(coordinator)
         self._api_endpoint = api_endpoint
-        self._grenton_id = grenton_id
+        self._grenton_object = grenton_object
         self._object_name = object_name
         self._state = None
-        self._unique_id = f"grenton_{grenton_id.split('->')[1]}"
+        self._unique_id = f"grenton_{grenton_object.object_id}"
 
     @property
     def name(self):
@@ -49,40 +68,25 @@ class GrentonSwitch(SwitchEntity):
     def unique_id(self):
         return self._unique_id
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(0, 1)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json=command
-            ) 
-            response.raise_for_status()
+            command = {"command": self._grenton_object.set(0, 1)}
             self._state = STATE_ON
-        except requests.RequestException as ex:
+            await self._async_command(command)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to turn on the switch: {ex}")
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         try:
-            command = {"command": f"{self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:set(0, 0)')"}
-            response = requests.post(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
+            command = {"command": self._grenton_object.set(0, 0)}
             self._state = STATE_OFF
-        except requests.RequestException as ex:
+            await self._async_command(command)
+        except aiohttp.ClientError as ex:
             _LOGGER.error(f"Failed to turn off the switch: {ex}")
 
-    def update(self):
-        try:
-            command = {"status": f"return {self._grenton_id.split('->')[0]}:execute(0, '{self._grenton_id.split('->')[1]}:get(0)')"}
-            response = requests.get(
-                f"{self._api_endpoint}",
-                json = command
-            )
-            response.raise_for_status()
-            data = response.json()
-            self._state = STATE_OFF if data.get("status") == 0 else STATE_ON
-        except requests.RequestException as ex:
-            _LOGGER.error(f"Failed to update the switch state: {ex}")
-            self._state = None
+    def _status_schema(self):
+        return STATUS_SCHEMA
+
+    def _update_from_status(self, data):
+        is_on = data.get("is_on")
+        self._state = None if is_on is None else (STATE_ON if is_on else STATE_OFF)
@@ -0,0 +1,27 @@
+"""Gate client failure handling."""
+import asyncio
+import tempfile
+import aiohttp
+from homeassistant.core import HomeAssistant
+from custom_components.grenton_objects.client import FAILURE_THRESHOLD, GrentonClient
+
+CLOSED_ENDPOINT = "http://127.0.0.1:1/HAlistener"
+STATUS_PAYLOAD = {"status": "CLU1:execute(0, 'DOU1:get(0)')"}
+
+async def count_failed_reads_until_unavailable():
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        try:
+            client = GrentonClient(hass, CLOSED_ENDPOINT)
+            reads = 0
+            while client.available:
+                try:
+                    await client.get(STATUS_PAYLOAD)
+                except aiohttp.ClientError:
+                    reads += 1
+            return reads
+        finally:
+            await hass.async_stop(force=True)
+
+def test_breaker_counts_reads_not_retries():
+    assert asyncio.run(count_failed_reads_until_unavailable()) == FAILURE_THRESHOLD
@@ -0,0 +1,44 @@
+"""Cover travel time learning."""
+import types
+from custom_components.grenton_objects import cover
+from custom_components.grenton_objects.cover import GrentonCover, STATE_CLOSING, STATE_OPENING
+from custom_components.grenton_objects.objects import GrentonObjectRef
+
+TRAVEL_TIME = 20
+SETTLE_TIME = 2
+
+def test_learned_travel_time_does_not_drift(monkeypatch):
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(cover, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(cover, "async_track_time_interval", lambda hass, action, interval: lambda: None)
+    entity = GrentonCover(None, None, GrentonObjectRef("CLU1->ROL1"), False, "Cover")
+
+    position = 0
+    for run in range(12):
+        state = STATE_OPENING if position == 0 else STATE_CLOSING
+        target = 100 - position
+        started = clock.now
+        entity._current_cover_position = position
+        entity._start_travel(state)
+
+        def read():
+            moved = min((clock.now - started) * 100 / TRAVEL_TIME, 100)
+            moving = moved < 100
+            current = position + moved if state == STATE_OPENING else position - moved
+            return {"motion": (1 if state == STATE_OPENING else 2) if moving else 0, "position": round(current), "tilt": 0}
+
+        # Polled after the settle time, then as the entity asks for.
+        clock.now += SETTLE_TIME
+        data = read()
+        entity._update_from_status(data)
+        while data["motion"]:
+            clock.now += entity._fast_poll_interval(data)
+            data = read()
+            entity._update_from_status(data)
+        position = target
+        clock.now += 60
+
+    # Learned from the first, closely polled motions only, within half a
+    # poll interval of the real travel time.
+    for state in (STATE_OPENING, STATE_CLOSING):
+        assert abs(entity._learned_travel_times[state] - TRAVEL_TIME) <= cover.MOVING_SCAN_INTERVAL / 2
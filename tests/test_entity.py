@@ -0,0 +1,93 @@
+"""Entity behaviour against the Gate simulator."""
+import asyncio
+import contextlib
+import tempfile
+import aiohttp
+from homeassistant.core import HomeAssistant
+from benchmarks.simulator import GateSimulator
+from custom_components.grenton_objects.client import GrentonClient
+from custom_components.grenton_objects.coordinator import GrentonCoordinator
+from custom_components.grenton_objects.cover import GrentonCover
+from custom_components.grenton_objects.light import GrentonLight
+from custom_components.grenton_objects.objects import GrentonObjectRef
+from custom_components.grenton_objects.switch import GrentonSwitch
+
+SIMULATOR_PORT = 8095
+
+async def failing_post(payload, platforms=None, clu_id=None):
+    raise aiohttp.ClientError("Gate refused the command")
+
+async def run_with_entity(create_entity, seed, action):
+    # Reads the entity once from a simulated Gate, then runs action.
+    simulator = GateSimulator()
+    endpoint = await simulator.start(port=SIMULATOR_PORT)
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        try:
+            client = GrentonClient(hass, endpoint)
+            coordinator = GrentonCoordinator(hass, client)
+            entity = create_entity(coordinator, endpoint)
+            entity.hass = hass
+            entity.entity_id = "test.grenton_entity"
+            grenton_object = entity._grenton_object
+            for index, value in seed.items():
+                simulator.set_feature(grenton_object.clu_id, grenton_object.object_id, index, value)
+            coordinator.register(
+                entity.entity_id,
+                entity._status_command(),
+                grenton_object,
+                entity._status_schema(),
+                entity._fast_poll_interval
+            )
+            coordinator.async_add_listener(entity._handle_coordinator_update)
+            await coordinator.async_refresh()
+            await action(entity, coordinator, simulator)
+            return entity
+        finally:
+            await simulator.stop()
+            await hass.async_stop(force=True)
+
+def run_failed_command(create_entity, seed, send_command):
+    async def action(entity, coordinator, simulator):
+        coordinator.client.post = failing_post
+        with contextlib.suppress(aiohttp.ClientError):
+            await send_command(entity)
+        entity._cancel_confirm()
+        # The read back finds the value unchanged on the Gate.
+        coordinator.mark_due(entity.entity_id)
+        await coordinator.async_refresh()
+    return asyncio.run(run_with_entity(create_entity, seed, action))
+
+def test_failed_switch_command_shows_gate_state():
+    entity = run_failed_command(
+        lambda coordinator, endpoint: GrentonSwitch(coordinator, endpoint, GrentonObjectRef("CLU1->DOU1"), "Switch"),
+        {0: 0},
+        lambda entity: entity.async_turn_on()
+    )
+    assert entity.is_on is False
+
+def test_failed_cover_command_stops_travel():
+    entity = run_failed_command(
+        lambda coordinator, endpoint: GrentonCover(coordinator, endpoint, GrentonObjectRef("CLU1->ROL1"), False, "Cover", 20, 20),
+        {0: 0, 7: 40},
+        lambda entity: entity.async_set_cover_position(position=80)
+    )
+    assert entity.is_opening is False
+    assert entity.current_cover_position == 40
+    assert entity._cancel_travel_update is None
+
+def test_held_commands_of_different_kinds_are_all_sent():
+    async def action(entity, coordinator, simulator):
+        await entity.async_turn_on(rgb_color=(0, 0, 255))
+        await entity.async_turn_on(rgb_color=(0, 255, 0))
+        await entity.async_turn_on(brightness=51)
+        await asyncio.sleep(entity._command_interval + 0.1)
+        action.features = simulator.objects[("CLU1", "LED1")]
+
+    asyncio.run(run_with_entity(
+        lambda coordinator, endpoint: GrentonLight(coordinator, endpoint, GrentonObjectRef("CLU1->LED1"), "RGB", "Light"),
+        {0: 0, 6: "#ff0000"},
+        action
+    ))
+    assert action.features[6] == "#00ff00"
+    assert action.features[0] == 0.2